@@ -8,36 +8,25 @@ Covering areas:
     - Config save/load;
     - Decoupled parameter server-client arch;
 """
-import ast
-import cProfile as profile
 # Import std-modules.
+import codecs
 import collections
-import concurrent.futures
-import configparser
+import contextlib
 import copy
-import csv
 import datetime
-import difflib
 import fnmatch
 import functools
-import gettext
 import glob
-import hashlib
 import importlib
 import json
 import linecache
 import locale
 import logging
-import logging.config
 import math
-import multiprocessing
 import operator
 import os
 import os.path as osp
 import platform
-import plistlib
-import pprint as pp
-import pstats
 import queue
 import re
 import shutil
@@ -48,13 +37,9 @@ import sys
 import tempfile
 import threading
 import time
-import tokenize
 import traceback
 import types
 import typing
-import urllib.parse
-import urllib.request
-import uuid
 import warnings
 from types import SimpleNamespace
 
@@ -192,6 +177,234 @@ class BandPassLogFilter(object):
         return self.__levelbounds[0] <= log.levelno <= self.__levelbounds[1]
 
 
+class JsonLinesLogFormatter(logging.Formatter):
+    """
+    Logging formatter: one compact JSON object per line, for log shippers.
+    - fixed key order: time, level, module, lineno, message, then exc_info/stack_info if any, then extra fields
+    - extra fields come from logger.info(msg, extra={...}); values that are not JSON-serializable fall back to repr()
+    - the encoder is built once, and the strftime() part of timestamps is reused within the same second
+    """
+    _reservedAttrs = frozenset(vars(logging.LogRecord('', logging.NOTSET, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=repr)
+        self._timeCache = (None, None)
+
+    def formatTime(self, record, datefmt=None):
+        sec, text = self._timeCache
+        if (created_sec := int(record.created)) != sec:
+            text = time.strftime(datefmt or self.default_time_format, self.converter(record.created))
+            self._timeCache = (created_sec, text)
+        return text if datefmt else self.default_msec_format % (text, record.msecs)
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'module': record.module,
+            'lineno': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        if extras := record.__dict__.keys() - self._reservedAttrs:
+            entry.update((key, value) for key, value in record.__dict__.items() if key in extras)
+        return self._encoder.encode(entry)
+
+
+class LazyLogger:
+    """
+    Proxy logger that builds its real logger on first emitted record.
+    - factory: arg-less callable returning a logging.Logger, e.g., lambda: build_default_logger(logdir, name='my')
+    - level guards, e.g., isEnabledFor(), never trigger the factory, so dropped records cost no disk i/o
+    - other attribute access, e.g., .handlers, materializes the logger and delegates to it
+    """
+
+    def __init__(self, factory, level=logging.NOTSET):
+        self._factory = factory
+        self._logger = None
+        self._level = level
+        self._lock = threading.Lock()
+
+    @property
+    def materialized(self):
+        return self._logger is not None
+
+    def materialize(self):
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    logger = self._factory()
+                    if self._level != logging.NOTSET:
+                        logger.setLevel(self._level)
+                    self._logger = logger
+        return self._logger
+
+    def setLevel(self, level):
+        self._level = logging._checkLevel(level)
+        if self._logger is not None:
+            self._logger.setLevel(self._level)
+
+    def getEffectiveLevel(self):
+        return self._logger.getEffectiveLevel() if self._logger is not None else self._level
+
+    def isEnabledFor(self, level):
+        if self._logger is not None:
+            return self._logger.isEnabledFor(level)
+        return level > logging.root.manager.disable and level >= self._level
+
+    def log(self, level, msg, *args, **kwargs):
+        if not self.isEnabledFor(level):
+            return
+        # report the caller's frame instead of this proxy's
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self.materialize().log(level, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def exception(self, msg, *args, exc_info=True, **kwargs):
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self.log(logging.ERROR, msg, *args, exc_info=exc_info, **kwargs)
+
+    def critical(self, msg, *args, **kwargs):
+        kwargs['stacklevel'] = kwargs.get('stacklevel', 1) + 1
+        self.log(logging.CRITICAL, msg, *args, **kwargs)
+
+    def __getattr__(self, name):
+        # only reached for attributes missing on the proxy, e.g., handlers, name, addHandler
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+
+class BoundedLogQueue(queue.Queue):
+    """
+    Bounded record queue for QueueHandler/QueueListener, applying an overflow policy when full.
+    - block: wait for a free slot; lossless, but stalls the caller while the listener lags behind
+    - drop_oldest: evict the oldest queued record to make room
+    - drop_debug: discard incoming records below INFO; block for the rest
+    - QueueListener's stop sentinel (None) always blocks so that records queued before it still get written
+    """
+
+    def __init__(self, maxsize=10000, overflow='block'):
+        assert overflow in ('block', 'drop_oldest', 'drop_debug')
+        super().__init__(maxsize)
+        self.overflow = overflow
+        self.nDropped = 0
+
+    def put_nowait(self, item):
+        """
+        - QueueHandler.enqueue() and QueueListener.enqueue_sentinel() both land here
+        """
+        if item is None or self.overflow == 'block':
+            return self.put(item)
+        while True:
+            try:
+                return self.put(item, block=False)
+            except queue.Full:
+                pass
+            if self.overflow == 'drop_debug':
+                if item.levelno < logging.INFO:
+                    self.nDropped += 1
+                    return
+                return self.put(item)
+            try:
+                self.get(block=False)
+                self.task_done()
+                self.nDropped += 1
+            except queue.Empty:
+                pass
+
+
+class GzipLogRotator:
+    """
+    Rotator for RotatingFileHandler/TimedRotatingFileHandler that gzips rolled files on a background thread.
+    - install: handler.namer, handler.rotator = rotator.namer, rotator
+    - the rolled file is renamed synchronously, then compressed and removed in the background
+    - handlers call namer() before shifting/removing backups, so namer() awaits the pending compression to keep backups consistent
+    - compression threads are non-daemon, so a pending compression completes before interpreter exit
+    """
+
+    def __init__(self):
+        self.thread = None
+
+    def namer(self, name):
+        self.join()
+        return f'{name}.gz'
+
+    def __call__(self, source, dest):
+        self.join()
+        rolled = dest.removesuffix('.gz')
+        os.replace(source, rolled)
+        self.thread = threading.Thread(target=self._compress, args=(rolled, dest))
+        self.thread.start()
+
+    def join(self):
+        if self.thread:
+            self.thread.join()
+
+    @staticmethod
+    def _compress(src, dst):
+        import gzip
+        with open(src, 'rb') as fi, gzip.open(dst, 'wb') as fo:
+            shutil.copyfileobj(fi, fo)
+        os.remove(src)
+
+
+class FileBackedOutput:
+    """
+    Lazily-read view of subprocess output streamed to a file, standing in for bytes.
+    - nothing is loaded into memory until read(), bytes() or decode() is called
+    - iter_chunks() scans the output in constant memory
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __len__(self):
+        return osp.getsize(self.path) if osp.isfile(self.path) else 0
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __bytes__(self):
+        return self.read()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.path!r})'
+
+    def read(self, size=-1, offset=0):
+        with open(self.path, 'rb') as fp:
+            fp.seek(offset)
+            return fp.read(size)
+
+    def iter_chunks(self, chunk_size=65536):
+        with open(self.path, 'rb') as fp:
+            yield from iter(functools.partial(fp.read, chunk_size), b'')
+
+    def decode(self, encoding='utf-8', errors='strict'):
+        return self.read().decode(encoding, errors)
+
+
 class OfflineJSON:
     def __init__(self, file_path):
         self.path = file_path
@@ -229,20 +442,34 @@ class RerunLock:
     - use semaphore-like behaviour with an instance limit
     - Because lockfile is created by pyutil, we also save the occupier pid and .py path (name) in it
     - if name is a path, e.g., __file__, then lockfile will be named after its basename
-    """
-
-    def __init__(self, name, folder=None, logger=None, max_instances=1):
+    - backend:
+      - 'file': a lockfile per instance; check-then-create is racy and needs a folder scan per lock()
+      - 'flock': an OS advisory lock on one of max_instances slot files; acquired atomically and released by the OS when the process dies
+    - zombie locks left by crashed processes are swept when they would block lock(),
+      and at most every zombie_sweep_interval seconds per process and name on construction
+    - install_signal_handlers: unlock on termination signals; turn off for locks created in hot paths or owned by frameworks handling signals
+    """
+    # (folder, name stem) -> last sweep time
+    lastSweepTimes = {}
+
+    def __init__(self, name, folder=None, logger=None, max_instances=1, backend='file', install_signal_handlers=True, zombie_sweep_interval=60):
+        if backend not in ('file', 'flock'):
+            raise ValueError(f'Unsupported lock backend: {backend}; expected: file, flock')
         folder = folder or osp.join(get_platform_tmp_dir(), '_util')
         filename = f'lock_{extract_path_stem(name)}.{os.getpid()}.lock.json'
         self.name = name
         self.lockFile = osp.join(folder, filename)
         self.nMaxInstances = max_instances
         self.logger = logger or glogger
+        self.backend = backend
+        # flock: slot file held open and locked
+        self.slotFile = None
+        self.slotFd = None
         # CAUTION:
         # - windows grpc server crashes with signals:
         #   - ValueError: signal only works in main thread of the main interpreter
         # - signals are disabled for windows
-        if threading.current_thread() is threading.main_thread():
+        if install_signal_handlers and threading.current_thread() is threading.main_thread():
             common_sigs = [
                 signal.SIGABRT,
                 signal.SIGFPE,
@@ -272,14 +499,37 @@ class RerunLock:
             ]
             for sig in common_sigs + plat_sigs:
                 signal.signal(sig, self.handle_signal)
+        if backend == 'flock':
+            # the OS drops the locks of dead processes: no zombies
+            return
         # cleanup zombie locks due to runtime exceptions
-        locks = [osp.basename(lock) for lock in glob.glob(osp.join(osp.dirname(self.lockFile), f'lock_{extract_path_stem(self.name)}.*.lock.json'))]
-        zombie_locks = [lock for lock in locks if not is_pid_running(int(lock.split(".")[1]))]
-        for lock in zombie_locks:
-            safe_remove(osp.join(osp.dirname(self.lockFile), lock))
+        sweep_key = (osp.dirname(self.lockFile), extract_path_stem(name))
+        now = time.monotonic()
+        if (last_sweep := RerunLock.lastSweepTimes.get(sweep_key)) is None or now - last_sweep >= zombie_sweep_interval:
+            RerunLock.lastSweepTimes[sweep_key] = now
+            self._sweep_zombies(self._find_locks())
+
+    def _find_locks(self):
+        return [osp.basename(lock) for lock in glob.glob(osp.join(osp.dirname(self.lockFile), f'lock_{extract_path_stem(self.name)}.*.lock.json'))]
+
+    def _sweep_zombies(self, locks):
+        """
+        - remove the locks of dead processes; return the live ones
+        """
+        live_locks = []
+        for lock in locks:
+            if is_pid_running(int(lock.split(".")[1])):
+                live_locks.append(lock)
+            else:
+                safe_remove(osp.join(osp.dirname(self.lockFile), lock))
+        return live_locks
 
     def lock(self):
-        locks = [osp.basename(lock) for lock in glob.glob(osp.join(osp.dirname(self.lockFile), f'lock_{extract_path_stem(self.name)}.*.lock.json'))]
+        if self.backend == 'flock':
+            return self._lock_slot()
+        locks = self._find_locks()
+        if len(locks) >= self.nMaxInstances:
+            locks = self._sweep_zombies(locks)
         is_locked = len(locks) >= self.nMaxInstances
         if is_locked:
             locker_pids = [int(lock.split(".")[1]) for lock in locks]
@@ -293,6 +543,8 @@ class RerunLock:
         return True
 
     def unlock(self):
+        if self.backend == 'flock':
+            return self._unlock_slot()
         try:
             os.remove(self.lockFile)
         except FileNotFoundError:
@@ -311,14 +563,61 @@ Advice:
         return True
 
     def unlock_all(self):
+        if self.backend == 'flock':
+            # other processes' OS locks cannot be broken; they go with their processes
+            if self.slotFd is not None:
+                self._unlock_slot()
+            return True
         locks = glob.glob(osp.join(osp.dirname(self.lockFile), f'lock_{osp.basename(self.name)}.*.lock.json'))
         for lock in locks:
             os.remove(lock)
         return True
 
     def is_locked(self):
+        if self.backend == 'flock':
+            return self.slotFd is not None
         return osp.isfile(self.lockFile)
 
+    def _get_slot_files(self):
+        folder = osp.dirname(self.lockFile)
+        return [osp.join(folder, f'lock_{extract_path_stem(self.name)}.slot{s}.lock') for s in range(self.nMaxInstances)]
+
+    def _lock_slot(self):
+        if self.slotFd is not None:
+            return True
+        slot_files = self._get_slot_files()
+        os.makedirs(osp.dirname(self.lockFile), exist_ok=True)
+        for slot_file in slot_files:
+            fd = os.open(slot_file, os.O_RDWR | os.O_CREAT, 0o666)
+            if not _try_lock_fd(fd):
+                os.close(fd)
+                continue
+            # for diagnostics only; slot files are never deleted, because another process may be opening them to lock
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps({'pid': os.getpid(), 'name': self.name}).encode(TXT_CODEC))
+            self.slotFile, self.slotFd = slot_file, fd
+            return True
+        locker_pids = []
+        for slot_file in slot_files:
+            try:
+                locker_pids.append(load_json(slot_file)['pid'])
+            except Exception:
+                pass
+        self.logger.warning(f'{self.name} is locked by processes: {locker_pids}. Will block new instances until unlocked.')
+        return False
+
+    def _unlock_slot(self):
+        if self.slotFd is None:
+            self.logger.warning(f'{self.name} already unlocked. Safely ignored.')
+            return False
+        fd, self.slotFd = self.slotFd, None
+        try:
+            os.ftruncate(fd, 0)
+            _unlock_fd(fd)
+        finally:
+            os.close(fd)
+        return True
+
     def handle_signal(self, sig, frame):
         msg = f'Terminated due to signal: {signal.Signals(sig).name}; Will unlock'
         self.logger.warning(msg)
@@ -415,37 +714,152 @@ class Cache:
       - tree_cache = Cache('/path/to/file.tree', lambda: src: load_data(src), '/tmp/my_app')
       - # ... later
       - cached_tree_data = tree_cache.retrieve()
-    """
-
-    def __init__(self, data_source, data_retriever, cache_dir=get_platform_tmp_dir(), cache_type='cache', algo='checksum', source_seed='6ba7b810-9dad-11d1-80b4-00c04fd430c8'):
-        assert algo in ['checksum', 'mtime']
+    - memory_tier: also keep retrieved data in process memory, shared by all instances of the same cache file
+      - a hit is validated by stat-ing the source: (size, mtime_ns, inode), without hashing, reading or parsing anything
+      - hits return the same object: treat it as read-only
+      - the tier holds the most recently used memoryTierSize entries
+    - algo:
+      - 'checksum': hash the whole source on every retrieve()
+      - 'mtime': compare modified time only
+      - 'hybrid': keep the checksum and the source's (size, mtime_ns, inode) in the cache; rehash only when the stat changes
+    - reverify_interval: for 'hybrid', also rehash once the last hashing is that many seconds old,
+      against in-place edits that preserve the stat, e.g., on filesystems with coarse timestamps
+    - serializer: payload format: 'json' (indented, the legacy layout), 'json-compact', 'pickle', or 'marshal'
+      - pickle and marshal lift the JSON-type restriction on retrieved data; marshal is the fastest for builtin types but ties caches to the Python version
+    - compression: None, 'zlib', or 'lzma'
+    - except for uncompressed 'json', the cache file is binary, with its format in a header line ahead of the payload,
+      so that instances with different serializers read each other's caches, and the header is read without the payload
+      - pickle and marshal payloads are only loaded by instances using that serializer; others rebuild the cache, because loading them can run planted code
+    - store: a CacheStore to keep the cache in, bounding the folder's size; overrides cache_dir
+    - data_source can also be a folder, a glob pattern, or a list of them, for data depending on many files; the retriever receives it as is
+      - the hash is a root hash over per-file leaves, each file's checksum, or its stat for 'mtime'
+      - 'hybrid' keeps the per-file (size, mtime_ns, inode, checksum) table in the cache and only rehashes files whose stat changed
+      - the memory tier validates by stat-ing every file
+      - whether the source is a tree is decided on construction
+    """
+    # cache file -> (source stat, source hash, data, time of the last hashing, per-file table of a tree source), least recently used first
+    memoryTier = collections.OrderedDict()
+    memoryTierSize = 128
+    memoryTierLock = threading.Lock()
+
+    def __init__(self, data_source, data_retriever, cache_dir=get_platform_tmp_dir(), cache_type='cache', algo='checksum', source_seed='6ba7b810-9dad-11d1-80b4-00c04fd430c8', memory_tier=False, reverify_interval=None, serializer='json', compression=None, store=None):
+        assert algo in ['checksum', 'mtime', 'hybrid']
+        assert serializer in _CACHE_SERIALIZERS, f'Unsupported cache serializer: {serializer}; expected: {", ".join(_CACHE_SERIALIZERS)}'
+        assert compression in _CACHE_COMPRESSORS, f'Unsupported cache compression: {compression}; expected: {", ".join(map(str, _CACHE_COMPRESSORS))}'
+        self.serializer = serializer
+        self.compression = compression
         self.srcURL = data_source
         self.retriever = data_retriever
+        # an existing file is never a pattern, even with glob characters in its name
+        self.srcIsTree = isinstance(data_source, (list, tuple)) or (not osp.isfile(data_source) and (osp.isdir(data_source) or re.search(r'[*?[]', data_source) is not None))
+        # tree: file -> [size, mtime_ns, inode, checksum]
+        self.srcTree = {}
+        import uuid
         # use a fixed namespace for each data-source to ensure inter-session consistency
         namespace = uuid.UUID(str(source_seed))
-        uid = str(uuid.uuid5(namespace, self.srcURL))
-        self.cacheFile = osp.join(cache_dir, f'{uid}.{cache_type}.json')
+        uid = str(uuid.uuid5(namespace, '\n'.join(data_source) if isinstance(data_source, (list, tuple)) else self.srcURL))
+        self.store = store
+        self.cacheFile = osp.join(store.folder if store else cache_dir, f'{uid}.{cache_type}.json')
         self.hashAlgo = algo
+        self.useMemoryTier = memory_tier
+        self.reverifyInterval = reverify_interval
+        # hybrid: source stat and time of the last hashing, as saved with the cache
+        self.prevSrcStat = None
+        self.lastVerifyTime = None
+        self.headerDirty = False
         # first comparison needs
-        self.prevSrcHash = load_json(self.cacheFile).get('hash') if osp.isfile(self.cacheFile) else None
+        if memory_tier and (entry := Cache.memoryTier.get(self.cacheFile)):
+            self.prevSrcStat, self.prevSrcHash, self.lastVerifyTime, self.srcTree = entry[0], entry[1], entry[3], entry[4]
+        else:
+            header = _load_cache_file(self.cacheFile, header_only=True)[0] if osp.isfile(self.cacheFile) else {}
+            self.prevSrcHash = header.get('hash')
+            self.prevSrcStat = tuple(src_stat) if (src_stat := header.get('stat')) else None
+            self.lastVerifyTime = header.get('verified')
+            self.srcTree = header.get('tree') or {}
 
     def retrieve(self):
+        # stat before retrieving, so that a source changing meanwhile invalidates the memory entry
+        src_stat = self._stat_source() if self.useMemoryTier else None
+        if src_stat is not None:
+            with Cache.memoryTierLock:
+                entry = Cache.memoryTier.get(self.cacheFile)
+                if is_hit := entry is not None and entry[0] == src_stat and not self._is_reverify_due():
+                    Cache.memoryTier.move_to_end(self.cacheFile)
+                    self.prevSrcStat, self.prevSrcHash, self.lastVerifyTime, self.srcTree = entry[0], entry[1], entry[3], entry[4]
+            if is_hit:
+                if self.store:
+                    self.store.touch(self.cacheFile)
+                return entry[2]
         if self._compare_hash():
-            return self.update()
-        return load_json(self.cacheFile)['data']
+            return self.update(src_stat)
+        try:
+            data = _load_cache_file(self.cacheFile, trusted_formats=(*_SAFE_CACHE_FORMATS, self.serializer))[1]
+        except (FileNotFoundError, ValueError):
+            # evicted by a store or deleted meanwhile, or saved in a format this instance does not trust
+            return self.update(src_stat)
+        if self.store:
+            self.store.touch(self.cacheFile)
+        if self.headerDirty:
+            # content unchanged, but the stat or verification time is new: save them to skip rehashing next time
+            self._save(data)
+        self._remember(src_stat, data)
+        return data
 
-    def update(self):
+    def update(self, src_stat=None):
         """
         - update cache directly
         - useful when app needs to force update cache
         """
+        if self.useMemoryTier and src_stat is None:
+            src_stat = self._stat_source()
         data = self.retriever(self.srcURL)
-        container = {
-            'data': data,
+        self._save(data)
+        self._remember(src_stat, data)
+        return data
+
+    def _save(self, data):
+        header = {
             'hash': self.prevSrcHash,
         }
-        save_json(self.cacheFile, container)
-        return data
+        if self.hashAlgo == 'hybrid':
+            header['stat'] = self.prevSrcStat
+            header['verified'] = self.lastVerifyTime
+            if self.srcIsTree:
+                header['tree'] = self.srcTree
+        if self.serializer == 'json' and self.compression is None:
+            save_json(self.cacheFile, {'data': data, **header})
+        else:
+            _save_cache_file(self.cacheFile, header, data, self.serializer, self.compression)
+        self.headerDirty = False
+        if self.store:
+            self.store.record(self.cacheFile)
+
+    def _is_reverify_due(self):
+        if self.hashAlgo != 'hybrid' or self.reverifyInterval is None:
+            return False
+        return self.lastVerifyTime is None or time.time() - self.lastVerifyTime >= self.reverifyInterval
+
+    def _stat_source(self):
+        if self.srcIsTree:
+            import hashlib
+            tree_hash = hashlib.md5()
+            for file, file_stat in self._scan_tree().items():
+                tree_hash.update(f'{file}\0{file_stat}\n'.encode(TXT_CODEC))
+            return tree_hash.hexdigest()
+        try:
+            stat = os.stat(self.srcURL)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def _remember(self, src_stat, data):
+        if src_stat is None:
+            return
+        with Cache.memoryTierLock:
+            Cache.memoryTier[self.cacheFile] = (src_stat, self.prevSrcHash, data, self.lastVerifyTime, self.srcTree)
+            Cache.memoryTier.move_to_end(self.cacheFile)
+            while len(Cache.memoryTier) > Cache.memoryTierSize:
+                Cache.memoryTier.popitem(last=False)
 
     def _compare_hash(self):
         in_src_hash = self._compute_hash()
@@ -454,9 +868,12 @@ class Cache:
         return changed
 
     def _compute_hash(self):
+        if self.srcIsTree:
+            return self._compute_hash_of_tree()
         hash_algo_map = {
             'checksum': self._compute_hash_as_checksum,
             'mtime': self._compute_hash_as_modified_time,
+            'hybrid': self._compute_hash_as_stat_or_checksum,
         }
         return hash_algo_map[self.hashAlgo]()
 
@@ -469,6 +886,420 @@ class Cache:
         except FileNotFoundError:
             return None
 
+    def _scan_tree(self):
+        """
+        - return {file: [size, mtime_ns, inode]} of all files in the source folders or glob patterns, sorted by path
+        """
+        patterns = self.srcURL if isinstance(self.srcURL, (list, tuple)) else [self.srcURL]
+        files = set()
+        for pattern in patterns:
+            if osp.isdir(pattern):
+                files.update(osp.join(folder, name) for folder, _, names in os.walk(pattern) for name in names)
+            else:
+                files.update(glob.glob(pattern, recursive=True))
+        import stat
+        tree = {}
+        for file in sorted(files):
+            try:
+                file_stat = os.stat(file)
+            except OSError:
+                continue
+            if stat.S_ISREG(file_stat.st_mode):
+                tree[file] = [file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino]
+        return tree
+
+    def _compute_hash_of_tree(self):
+        """
+        - root hash over per-file leaves, invariant to scanning order
+        - hybrid: reuse the checksum of each file whose stat is unchanged; the rest are rehashed and saved with the cache
+        """
+        import hashlib
+        tree_hash = hashlib.md5()
+        if self.hashAlgo == 'mtime':
+            for file, file_stat in self._scan_tree().items():
+                tree_hash.update(f'{file}\0{file_stat}\n'.encode(TXT_CODEC))
+            return tree_hash.hexdigest()
+        rehash_all = self.hashAlgo == 'checksum' or self._is_reverify_due()
+        if rehash_all:
+            self.lastVerifyTime = time.time()
+        tree = {}
+        for file, file_stat in self._scan_tree().items():
+            if not rehash_all and (prev_entry := self.srcTree.get(file)) and prev_entry[:3] == file_stat:
+                tree[file] = prev_entry
+            else:
+                tree[file] = file_stat + [get_md5_checksum(file)]
+            tree_hash.update(f'{file}\0{tree[file][3]}\n'.encode(TXT_CODEC))
+        if tree != self.srcTree or rehash_all:
+            self.srcTree = tree
+            self.headerDirty = self.hashAlgo == 'hybrid'
+        return tree_hash.hexdigest()
+
+    def _compute_hash_as_stat_or_checksum(self):
+        # stat before hashing, so that a source changing meanwhile is rehashed next time
+        src_stat = self._stat_source()
+        if src_stat is not None and src_stat == self.prevSrcStat and self.prevSrcHash is not None and not self._is_reverify_due():
+            return self.prevSrcHash
+        self.prevSrcStat = src_stat
+        self.lastVerifyTime = time.time()
+        self.headerDirty = True
+        return get_md5_checksum(self.srcURL)
+
+
+class CacheStore:
+    """
+    Size-bounded folder of Cache files, evicting the least recently ('lru') or least frequently ('lfu') used ones.
+    - usage:
+      store = CacheStore('/tmp/my_app', max_bytes=100 * 1024 ** 2)
+      cache = Cache(src, retriever, store=store)
+    - sizes, access times and hits live in a small index file in the folder, so enforcing the budget never scans the folder
+    - once over budget, evict down to 90% of it, so that ranking the entries is amortized over many writes
+    - the index is loaded once, and saved at most every flush_interval seconds and at exit;
+      saving merges the entries of other processes sharing the folder
+    - caches written before the store existed are unknown to the index and never evicted; rebuild_index() adopts them
+    """
+
+    def __init__(self, folder, max_bytes=None, max_entries=None, policy='lru', flush_interval=10):
+        assert policy in ['lru', 'lfu']
+        self.folder = folder
+        self.indexFile = osp.join(folder, 'cache_index.json')
+        self.maxBytes = max_bytes
+        self.maxEntries = max_entries
+        self.policy = policy
+        self.flushInterval = flush_interval
+        self.lock = threading.Lock()
+        # cache file name -> [size, last access time, hits]
+        self.entries = self._load_index()
+        self.totalBytes = sum(entry[0] for entry in self.entries.values())
+        # evicted since the last flush, so that merging does not resurrect them
+        self.droppedNames = set()
+        self.lastFlushTime = time.time()
+        self.isDirty = False
+        self.nEvicted = 0
+        import atexit
+        atexit.register(self.flush)
+
+    def record(self, cache_file):
+        """
+        - account for a cache file just written, then evict others while over budget
+        """
+        name = osp.basename(cache_file)
+        size = osp.getsize(cache_file)
+        with self.lock:
+            prev_entry = self.entries.get(name)
+            self.totalBytes += size - (prev_entry[0] if prev_entry else 0)
+            self.entries[name] = [size, time.time(), prev_entry[2] if prev_entry else 0]
+            self.droppedNames.discard(name)
+            self.isDirty = True
+            self._evict(keep=name)
+            if time.time() - self.lastFlushTime >= self.flushInterval:
+                self._flush()
+
+    def touch(self, cache_file):
+        """
+        - account for a cache hit
+        """
+        with self.lock:
+            if (entry := self.entries.get(osp.basename(cache_file))) is None:
+                return
+            entry[1] = time.time()
+            entry[2] += 1
+            self.isDirty = True
+            if entry[1] - self.lastFlushTime >= self.flushInterval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            if self.isDirty:
+                self._flush()
+
+    def rebuild_index(self):
+        """
+        - scan the folder once to adopt unknown cache files and forget missing ones, then enforce the budget
+        """
+        with self.lock:
+            names = {osp.basename(file) for file in glob.glob(osp.join(self.folder, '*.*.json')) if file != self.indexFile}
+            for name in set(self.entries) - names:
+                self.totalBytes -= self.entries.pop(name)[0]
+            for name in names - set(self.entries):
+                stat = os.stat(osp.join(self.folder, name))
+                self.entries[name] = [stat.st_size, stat.st_atime, 0]
+                self.totalBytes += stat.st_size
+            self._evict()
+            self._flush(merge=False)
+
+    def _is_over_budget(self, headroom=False):
+        max_bytes = self.maxBytes - self.maxBytes // 10 if headroom and self.maxBytes else self.maxBytes
+        max_entries = self.maxEntries - self.maxEntries // 10 if headroom and self.maxEntries else self.maxEntries
+        return (max_bytes is not None and self.totalBytes > max_bytes) or (max_entries is not None and len(self.entries) > max_entries)
+
+    def _evict(self, keep=None):
+        if not self._is_over_budget():
+            return
+        rank = (lambda item: item[1][1]) if self.policy == 'lru' else (lambda item: (item[1][2], item[1][1]))
+        for name, entry in sorted(self.entries.items(), key=rank):
+            if not self._is_over_budget(headroom=True):
+                break
+            if name == keep:
+                continue
+            cache_file = osp.join(self.folder, name)
+            safe_remove(cache_file)
+            with Cache.memoryTierLock:
+                Cache.memoryTier.pop(cache_file, None)
+            del self.entries[name]
+            self.totalBytes -= entry[0]
+            self.droppedNames.add(name)
+            self.nEvicted += 1
+
+    def _load_index(self):
+        try:
+            return load_json(self.indexFile)
+        except (OSError, ValueError):
+            return {}
+
+    def _flush(self, merge=True):
+        # removed along with its caches
+        if not osp.isdir(self.folder):
+            return
+        if merge:
+            for name, entry in self._load_index().items():
+                if name in self.droppedNames:
+                    continue
+                if (mine := self.entries.get(name)) is None:
+                    self.entries[name] = entry
+                    self.totalBytes += entry[0]
+                else:
+                    mine[1] = max(mine[1], entry[1])
+                    mine[2] = max(mine[2], entry[2])
+        tmp_file = f'{self.indexFile}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w', encoding=TXT_CODEC) as f:
+            json.dump(self.entries, f, separators=(',', ':'))
+        os.replace(tmp_file, self.indexFile)
+        self.droppedNames.clear()
+        self.lastFlushTime = time.time()
+        self.isDirty = False
+
+
+class ConcurProgress:
+    """
+    Progress and throughput metrics of a concur_imap() or concur_map() run, counted in items.
+    - callback(progress): called as items complete, at most every interval seconds, and once at the end
+    - latencyHistogram: worker time per item in power-of-two millisecond buckets: {upper_bound_ms: count}
+    - completed items include failed ones; items are counted as their tasks finish, even while an ordered caller waits for an earlier one
+      - so the callback may run on the pool's threads; metrics are updated under lock
+    - get_stragglers() lists tasks running longer than expected, to spot slow items while a batch is still running
+    """
+
+    def __init__(self, callback=None, interval=1.0):
+        self.callback = callback
+        self.interval = interval
+        self.total = None
+        self.nSubmitted = 0
+        self.nCompleted = 0
+        self.nFailed = 0
+        self.startTime = None
+        self.endTime = None
+        self.latencyHistogram = collections.Counter()
+        # task -> (submitted time, index of first item)
+        self.inflightTasks = {}
+        self.lastReportTime = None
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        total = '?' if self.total is None else self.total
+        eta = '?' if (eta := self.eta) is None else f'{eta:.1f}s'
+        return f'completed {self.nCompleted}/{total} ({self.nFailed} failed), in-flight {self.nInflight}, {self.throughput:.1f} items/s, ETA {eta}'
+
+    @property
+    def nInflight(self):
+        return self.nSubmitted - self.nCompleted
+
+    @property
+    def elapsed(self):
+        if self.startTime is None:
+            return 0.0
+        return (self.endTime or time.perf_counter()) - self.startTime
+
+    @property
+    def throughput(self):
+        return self.nCompleted / elapsed if (elapsed := self.elapsed) > 0 else 0.0
+
+    @property
+    def eta(self):
+        """
+        - seconds left at the current throughput; None if the total is unknown or nothing completed yet
+        """
+        if self.total is None or not self.throughput:
+            return None
+        return (self.total - self.nCompleted) / self.throughput
+
+    def get_stragglers(self, min_age):
+        """
+        - [(first_item_index, age_in_seconds), ...] of in-flight tasks older than min_age, oldest first
+        - queuing time counts, so compare min_age against latencies multiplied by the queue depth
+        """
+        with self.lock:
+            inflight_tasks = list(self.inflightTasks.values())
+        now = time.perf_counter()
+        stragglers = [(first_index, now - submitted) for submitted, first_index in inflight_tasks]
+        return sorted([straggler for straggler in stragglers if straggler[1] > min_age], key=lambda straggler: -straggler[1])
+
+    def start(self, total=None):
+        self.total = total
+        self.startTime = self.lastReportTime = time.perf_counter()
+        self.endTime = None
+
+    def submit(self, task, first_index, n_items):
+        with self.lock:
+            self.inflightTasks[task] = (time.perf_counter(), first_index)
+            self.nSubmitted += n_items
+
+    def complete(self, task, outcomes):
+        """
+        - outcomes: [(index, result, error, seconds), ...] of a task; empty for a cancelled or broken task
+        - counts a task once: repeated calls and tasks finishing after finish() are ignored
+        """
+        with self.lock:
+            if self.inflightTasks.pop(task, None) is None:
+                return
+            for outcome in outcomes:
+                self.nCompleted += 1
+                if outcome[2] is not None:
+                    self.nFailed += 1
+                if (seconds := outcome[3]) is not None:
+                    self.latencyHistogram[1 << (max(1, math.ceil(seconds * 1000)) - 1).bit_length()] += 1
+            if not self.callback or (now := time.perf_counter()) - self.lastReportTime < self.interval:
+                return
+            self.lastReportTime = now
+        # outside the lock, so that the callback may query the progress
+        self.callback(self)
+
+    def finish(self):
+        with self.lock:
+            self.endTime = time.perf_counter()
+            self.inflightTasks.clear()
+        if self.callback:
+            self.callback(self)
+
+
+class TimeoutProcessPool:
+    """
+    Warm worker processes for process_timeout(), saving a process spawn and module imports per call.
+    - size: max number of concurrently busy workers; workers start on demand and stay warm
+    - max_tasks: recycling policy: retire a worker after serving that many calls; None means never
+    - a timed-out worker gets terminated; a fresh one replaces it on the next demand
+    - workers are daemonic, so decorated functions must not spawn multiprocessing children
+    - usage:
+      pool = TimeoutProcessPool(size=4)
+      @process_timeout(5, pool=pool)
+      def my_func(): ...
+      # ... later
+      pool.shutdown()
+    """
+
+    def __init__(self, size=None, max_tasks=None, mp_context=None):
+        import multiprocessing
+        self.size = size or get_usable_cpu_count()
+        self.maxTasks = max_tasks
+        self.context = multiprocessing.get_context(mp_context)
+        # reuse the warmest worker first
+        self.idleWorkers = queue.LifoQueue()
+        self.busySlots = threading.BoundedSemaphore(self.size)
+        self.nSpawned = 0
+        self.nRetired = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def run(self, func_name, args, kwargs, timeout):
+        with self.busySlots:
+            worker = self._checkout()
+            try:
+                worker.conn.send((func_name, args, kwargs))
+                done = worker.conn.poll(timeout)
+                result = worker.conn.recv() if done else None
+            except (EOFError, OSError) as e:
+                self._retire(worker, graceful=False)
+                raise RuntimeError(f'{func_name}: pool worker (PID: {worker.proc.pid}) died unexpectedly') from e
+            if not done:
+                self._retire(worker, graceful=False)
+                raise TimeoutError(f"{func_name} timed out after {timeout} seconds")
+            worker.nTasks += 1
+            if self.maxTasks and worker.nTasks >= self.maxTasks:
+                self._retire(worker)
+            else:
+                self.idleWorkers.put(worker)
+            return result
+
+    def shutdown(self):
+        while True:
+            try:
+                self._retire(self.idleWorkers.get_nowait())
+            except queue.Empty:
+                break
+
+    def _checkout(self):
+        try:
+            return self.idleWorkers.get_nowait()
+        except queue.Empty:
+            pass
+        conn, child_conn = self.context.Pipe()
+        proc = self.context.Process(target=_run_pool_worker, args=(child_conn,), daemon=True)
+        proc.start()
+        child_conn.close()
+        self.nSpawned += 1
+        return types.SimpleNamespace(proc=proc, conn=conn, nTasks=0)
+
+    def _retire(self, worker, graceful=True):
+        if graceful:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.proc.join(1)
+        if worker.proc.is_alive():
+            worker.proc.terminate()
+            worker.proc.join(1)
+        if worker.proc.is_alive():
+            worker.proc.kill()
+            worker.proc.join()
+        worker.conn.close()
+        self.nRetired += 1
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag for functions run by thread_timeout(cancellable=True).
+    - threads cannot be killed from outside, so the function must poll the token between steps and return early
+    - sleep() waits on the token instead of time.sleep(), so that cancellation wakes it up immediately
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        self.event.set()
+
+    def check(self):
+        """
+        - raise concurrent.futures.CancelledError once cancelled
+        """
+        if self.event.is_set():
+            import concurrent.futures
+            raise concurrent.futures.CancelledError()
+
+    def sleep(self, seconds):
+        """
+        - return True if cancelled before the time is up
+        """
+        return self.event.wait(seconds)
+
 # endregion
 
 
@@ -492,12 +1323,23 @@ def get_posix_shell_cfgfile():
     return os.path.expanduser('~/.bash_profile' if os.getenv('SHELL') == '/bin/bash' else '~/.zshrc')
 
 
-def build_default_logger(logdir, name=None, verbose=False):
+def build_default_logger(logdir, name=None, verbose=False, async_io=False, queue_size=10000, overflow='block', rotation=None, jsonl=False, isolated=False):
     """
     create logger sharing global logging config except log file path
     - 'filename' in config is a filename; must prepend folder path to it.
     - name is log-id in config, and will get overwritten by subsequent in-process calls; THEREFORE, never build logger with the same name twice!
-    """
+    - async_io: callers only enqueue records; a background QueueListener does the console/file i/o
+      - queue_size and overflow configure the BoundedLogQueue in between
+      - call flush_logger() to await pending records, and shutdown_logger() to stop the listener
+    - rotation: dict of log-file rotation options; None means a plain ever-growing log file
+      - size-based: {'maxBytes': 10 * 1024 ** 2, 'backupCount': 5}
+      - time-based: {'when': 'midnight', 'interval': 1, 'backupCount': 7}, refer to logging.handlers.TimedRotatingFileHandler
+      - add 'compress': True to gzip rolled files on a background thread
+    - jsonl: write the log file as JSON lines using JsonLinesLogFormatter; console output stays human-readable
+    - isolated: configure the named logger only, leaving the root and 'default' loggers and all existing handlers alone
+      - for loggers built lazily, e.g., glogger, which must not override the app's logging config whenever they happen to be built
+    """
+    import logging.config
     os.makedirs(logdir, exist_ok=True)
     filename = name or osp.basename(osp.basename(logdir.strip('\\/')))
     log_path = osp.join(logdir, f'{filename}.log')
@@ -524,6 +1366,8 @@ def build_default_logger(logdir, name=None, verbose=False):
             },
             "file": {
                 "format": "%(asctime)s: %(levelname)s: %(pathname)s: %(lineno)d: \n%(message)s\n"
+            } if not jsonl else {
+                "()": "kkpyutil.JsonLinesLogFormatter"
             }
         },
         "handlers": {
@@ -548,6 +1392,13 @@ def build_default_logger(logdir, name=None, verbose=False):
                 "class": "logging.FileHandler",
                 "encoding": "utf-8",
                 "filename": log_path
+            } if not rotation else {
+                "level": "DEBUG",
+                "formatter": "file",
+                "()": "kkpyutil._build_rotating_file_handler",
+                "encoding": "utf-8",
+                "filename": log_path,
+                **rotation
             }
         },
         "loggers": {
@@ -566,16 +1417,136 @@ def build_default_logger(logdir, name=None, verbose=False):
     }
     if name:
         logging_config['loggers'][name] = logging_config['loggers']['default']
-    logging.config.dictConfig(logging_config)
-    return logging.getLogger(name or 'default')
+    if isolated:
+        assert name, 'must name an isolated logger'
+        _configure_isolated_logger(logging_config, name)
+    else:
+        logging.config.dictConfig(logging_config)
+    logger = logging.getLogger(name or 'default')
+    if async_io:
+        _enable_async_logging([logger] if isolated else [logging.getLogger(), logging.getLogger('default'), logger], queue_size, overflow, keep_exc_text=jsonl)
+    return logger
+
+
+def _configure_isolated_logger(logging_config, name):
+    """
+    - apply the part of a dictConfig config for one logger
+    - dictConfig() would also reset the other configured loggers, and close all existing handlers
+    """
+    import logging.config
+    configurator = logging.config.DictConfigurator(logging_config)
+    config = configurator.config
+    # same order as dictConfig(): handlers refer to filters and formatters by name
+    for section, configure in (('formatters', configurator.configure_formatter), ('filters', configurator.configure_filter), ('handlers', configurator.configure_handler)):
+        for key in list(config[section]):
+            config[section][key] = configure(config[section][key])
+            if section == 'handlers':
+                config[section][key].name = key
+    configurator.configure_logger(name, config['loggers'][name])
+
+
+def _build_rotating_file_handler(filename, encoding, compress=False, **rotation):
+    """
+    - factory for dictConfig: time-based if 'when' is given, otherwise size-based
+    """
+    import logging.handlers
+    handler_cls = logging.handlers.TimedRotatingFileHandler if 'when' in rotation else logging.handlers.RotatingFileHandler
+    handler = handler_cls(filename, encoding=encoding, **rotation)
+    if compress:
+        rotator = GzipLogRotator()
+        handler.namer, handler.rotator = rotator.namer, rotator
+    return handler
+
+
+_async_log_listeners = []
+
+
+def _enable_async_logging(loggers, queue_size, overflow, keep_exc_text=False):
+    """
+    - move the handlers shared by loggers behind a single QueueHandler
+    - all loggers must share the same handlers, as dictConfig sets up in build_default_logger()
+    - keep_exc_text: queue tracebacks apart from messages, for formatters with their own traceback field, e.g., JsonLinesLogFormatter
+    """
+    import atexit
+    import logging.handlers
+    log_queue = BoundedLogQueue(queue_size, overflow)
+    listener = logging.handlers.QueueListener(log_queue, *loggers[-1].handlers, respect_handler_level=True)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if keep_exc_text:
+        queue_handler.prepare = _prepare_queued_log_record
+    queue_handler.listener = listener
+    for logger in loggers:
+        logger.handlers = [queue_handler]
+    listener.start()
+    if not _async_log_listeners:
+        atexit.register(_stop_async_log_listeners)
+    _async_log_listeners.append(listener)
+
+
+def _prepare_queued_log_record(record):
+    """
+    - like QueueHandler.prepare(), but the traceback stays in exc_text instead of being merged into msg
+    - the handlers behind the queue still append it to plain-text output, as Formatter.format() does with exc_text
+    """
+    record = copy.copy(record)
+    record.message = record.getMessage()
+    if record.exc_info and not record.exc_text:
+        record.exc_text = logging.Formatter().formatException(record.exc_info)
+    # args and exc_info may not be picklable
+    record.msg, record.args, record.exc_info = record.message, None, None
+    return record
+
+
+def _stop_async_log_listeners():
+    while _async_log_listeners:
+        _async_log_listeners.pop().stop()
+
+
+def _collect_log_handlers(logger):
+    """
+    - see through QueueHandlers to the handlers doing actual i/o
+    """
+    handlers = []
+    for handler in logger.handlers:
+        listener = getattr(handler, 'listener', None)
+        handlers += list(listener.handlers) if listener else [handler]
+    return handlers
 
 
 def find_log_path(logger):
-    return next((handler.baseFilename for handler in logger.handlers if isinstance(handler, logging.FileHandler)), None)
+    return next((handler.baseFilename for handler in _collect_log_handlers(logger) if isinstance(handler, logging.FileHandler)), None)
+
+
+def flush_logger(logger):
+    """
+    - for async loggers, block until all queued records are handled
+    - then flush all handlers
+    """
+    for handler in logger.handlers:
+        if listener := getattr(handler, 'listener', None):
+            listener.queue.join()
+    for handler in _collect_log_handlers(logger):
+        handler.flush()
+
 
+def shutdown_logger(logger):
+    """
+    - for async loggers, drain the queue and stop the background listener
+    - then close all handlers; rebuild the logger to use it again
+    """
+    for handler in logger.handlers:
+        if (listener := getattr(handler, 'listener', None)) in _async_log_listeners:
+            _async_log_listeners.remove(listener)
+            listener.stop()
+    for handler in _collect_log_handlers(logger) + list(logger.handlers):
+        handler.close()
 
-glogger = build_default_logger(logdir=osp.join(get_platform_tmp_dir(), '_util'), name='util', verbose=True)
-glogger.setLevel(logging.DEBUG)
+
+def _build_glogger():
+    return build_default_logger(logdir=osp.join(get_platform_tmp_dir(), '_util'), name='util', verbose=True, isolated=True)
+
+
+glogger = LazyLogger(_build_glogger, level=logging.DEBUG)
 
 
 def catch_unknown_exception(exc_type, exc_value, exc_traceback):
@@ -586,7 +1557,14 @@ def catch_unknown_exception(exc_type, exc_value, exc_traceback):
     # sys.__excepthook__(*exc_info)  # Keep commented out to avoid msg dup.
 
 
-sys.excepthook = catch_unknown_exception
+def install_excepthook():
+    """
+    - opt-in: route uncaught exceptions to glogger
+    - returns the previous hook for restoring
+    """
+    prev_hook = sys.excepthook
+    sys.excepthook = catch_unknown_exception
+    return prev_hook
 
 
 def format_brief(title='', bullets=()):
@@ -720,8 +1698,115 @@ def save_json(path, config, encoding=TXT_CODEC):
         return json.dump(dict_config, f, ensure_ascii=False, indent=4)
 
 
+def _serialize_json_compact(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode(TXT_CODEC)
+
+
+def _serialize_json(data):
+    return json.dumps(data, ensure_ascii=False, indent=4).encode(TXT_CODEC)
+
+
+def _serialize_pickle(data):
+    import pickle
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _deserialize_pickle(payload):
+    import pickle
+    return pickle.loads(payload)
+
+
+def _serialize_marshal(data):
+    import marshal
+    return marshal.dumps(data)
+
+
+def _deserialize_marshal(payload):
+    import marshal
+    return marshal.loads(payload)
+
+
+def _compress_zlib(payload):
+    import zlib
+    return zlib.compress(payload)
+
+
+def _decompress_zlib(payload):
+    import zlib
+    return zlib.decompress(payload)
+
+
+def _compress_lzma(payload):
+    import lzma
+    return lzma.compress(payload)
+
+
+def _decompress_lzma(payload):
+    import lzma
+    return lzma.decompress(payload)
+
+
+# format -> (serialize, deserialize)
+_CACHE_SERIALIZERS = {
+    'json': (_serialize_json, json.loads),
+    'json-compact': (_serialize_json_compact, json.loads),
+    'pickle': (_serialize_pickle, _deserialize_pickle),
+    'marshal': (_serialize_marshal, _deserialize_marshal),
+}
+_CACHE_COMPRESSORS = {
+    None: (None, None),
+    'zlib': (_compress_zlib, _decompress_zlib),
+    'lzma': (_compress_lzma, _decompress_lzma),
+}
+_CACHE_FILE_MAGIC = b'kkpyutil.Cache\n'
+# formats that cannot run code when loaded
+_SAFE_CACHE_FORMATS = ('json', 'json-compact')
+
+
+def _save_cache_file(path, header, data, serializer, compression):
+    """
+    - binary layout: magic line, JSON header line with the payload format, then the payload
+    - write a temporary file and replace the cache, so that readers never see a partial one
+    """
+    payload = _CACHE_SERIALIZERS[serializer][0](data)
+    if compress := _CACHE_COMPRESSORS[compression][0]:
+        payload = compress(payload)
+    header = {**header, 'format': serializer, 'compression': compression}
+    os.makedirs(osp.dirname(path), exist_ok=True)
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(_CACHE_FILE_MAGIC)
+        f.write(json.dumps(header).encode(TXT_CODEC) + b'\n')
+        f.write(payload)
+    os.replace(tmp_file, path)
+
+
+def _load_cache_file(path, header_only=False, trusted_formats=_SAFE_CACHE_FORMATS):
+    """
+    - return (header, data) from a cache file in either layout; data is None if header_only
+    - the legacy JSON layout has to be parsed as a whole
+    - trusted_formats: payload formats allowed to be deserialized, raising ValueError for others
+      - never trust a header to pick pickle or marshal: anyone who can write the cache folder, e.g., the shared temp folder, could plant code to run
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(_CACHE_FILE_MAGIC)) != _CACHE_FILE_MAGIC:
+            container = load_json(path)
+            data = container.pop('data', None)
+            return container, None if header_only else data
+        header = json.loads(f.readline())
+        if header_only:
+            return header, None
+        if header.get('format') not in trusted_formats:
+            raise ValueError(f'Untrusted cache format: {header.get("format")}; expected: {", ".join(trusted_formats)}')
+        payload = f.read()
+    if decompress := _CACHE_COMPRESSORS[header.get('compression')][1]:
+        payload = decompress(payload)
+    return header, _CACHE_SERIALIZERS[header['format']][1](payload)
+
+
 def get_md5_checksum(file):
     """Compute md5 checksum of a file."""
+    import hashlib
     if not osp.isfile(file):
         return None
     myhash = hashlib.md5()
@@ -761,21 +1846,370 @@ def is_toplevel_function(func):
     return func.__qualname__ == func.__name__
 
 
-def concur_map(worker, coll, worker_count=None, iobound=True, logger=None):
+def concur_map(worker, coll, worker_count=None, iobound=True, logger=None, reuse_pool=False, progress=None):
     """
     - concurrent version of builtin map()
     - due to GIL, threading is only good for io-bound tasks
     - map function interface: worker((index, elem)) -> processed_elem
+    - reuse_pool: run on a persistent pool from get_executor_pool() instead of a throwaway one
+    - progress: a ConcurProgress to observe the run
+    - see concur_imap() for streaming large inputs
+    - submits all items up front: the whole result list is kept anyway, and a bounded window would stall all workers behind a slow item at its head
+    """
+    return list(concur_imap(worker, coll, worker_count, iobound, logger, max_inflight=sys.maxsize, reuse_pool=reuse_pool, progress=progress))
+
+
+def _read_cgroup_cpu_quota():
+    """
+    - CPU quota of the current cgroup as a fractional CPU count; None if unlimited or unavailable
+    - cgroup v2 first, nested path then root, then v1
+    """
+    cgroup_dirs = []
+    try:
+        with open('/proc/self/cgroup') as f:
+            cgroup_dirs = [osp.join('/sys/fs/cgroup', line.strip()[4:].lstrip('/')) for line in f if line.startswith('0::')]
+    except OSError:
+        pass
+    for cgroup_dir in cgroup_dirs + ['/sys/fs/cgroup']:
+        try:
+            with open(osp.join(cgroup_dir, 'cpu.max')) as f:
+                quota, period = f.read().split()[:2]
+            return None if quota == 'max' else int(quota) / int(period)
+        except (OSError, ValueError):
+            continue
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def get_usable_cpu_count():
+    """
+    - number of CPUs this process can actually run on: the affinity mask, capped by a container's cgroup CPU quota
+    - os.cpu_count() reports all CPUs of the host and ignores both
+    """
+    try:
+        n_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n_cpus = os.cpu_count() or 1
+    if quota := _read_cgroup_cpu_quota():
+        n_cpus = min(n_cpus, math.ceil(quota))
+    return max(1, n_cpus)
+
+
+_MAX_TUNED_IO_THREADS = 64
+
+
+def _concur_worker_count(iobound, worker_count=None):
+    """
+    - worker_count: 'auto' sizes by usable CPUs: that many processes, or the ThreadPoolExecutor default for threads
+    - None keeps the legacy defaults, leaving a CPU to the main process, but never fewer than one worker
+    """
+    if worker_count == 'auto':
+        n_cpus = get_usable_cpu_count()
+        return min(32, n_cpus + 4) if iobound else n_cpus
+    return worker_count or (10 if iobound else max(1, get_usable_cpu_count() - 1))
+
+
+def _run_sampled_concur_chunk(samples, worker, chunk, shared=False, timed=False):
+    wall, cpu = time.perf_counter(), time.thread_time()
+    outcomes = _run_concur_chunk(worker, chunk, shared, timed)
+    samples.append((time.perf_counter() - wall, time.thread_time() - cpu))
+    return outcomes
+
+
+def _tune_io_thread_count(samples, max_count):
+    """
+    - size threads by the measured blocking ratio: cpus * (1 + wait / compute)
+    """
+    wall = sum(sample[0] for sample in samples)
+    cpu = sum(sample[1] for sample in samples)
+    ratio = (wall - cpu) / cpu if cpu > 0 else max_count
+    return max(1, min(max_count, math.ceil(get_usable_cpu_count() * (1 + ratio))))
+
+
+_executor_pools = {}
+_executor_pools_lock = threading.Lock()
+
+
+def _forget_executor_pools():
+    """
+    - a forked child inherits the registry but not the pools' worker threads, so it must start afresh
+    """
+    global _executor_pools_lock
+    _executor_pools.clear()
+    _executor_pools_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_executor_pools)
+
+
+def _preload_modules(modules):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def get_executor_pool(iobound=True, worker_count=None, preload=(), warm_up=False):
+    """
+    - get a persistent executor from the module registry, keyed by kind, size and preloads, creating it on first use
+    - saves process spawns and re-imports when concur_map() runs in a loop; shut down with shutdown_executor_pools()
+    - preload: modules imported by each worker process on start, e.g., heavy dependencies of the worker function
+    - warm_up: start all workers now instead of on the first tasks
+    - a process pool broken by a crashed worker is replaced
+    """
+    import concurrent.futures
+    n_workers = _concur_worker_count(iobound, worker_count)
+    key = ('thread' if iobound else 'process', n_workers, tuple(preload))
+    with _executor_pools_lock:
+        pool = _executor_pools.get(key)
+        if pool is None or getattr(pool, '_broken', False):
+            if iobound:
+                pool = concurrent.futures.ThreadPoolExecutor(max_workers=n_workers)
+            else:
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=n_workers, initializer=_preload_modules if preload else None, initargs=(tuple(preload),))
+            _executor_pools[key] = pool
+        else:
+            warm_up = False
+    if warm_up:
+        # one task per worker spawns them all; threads hold theirs until all have started
+        task = threading.Barrier(n_workers).wait if iobound else os.getpid
+        concurrent.futures.wait([pool.submit(task) for _ in range(n_workers)])
+    return pool
+
+
+def shutdown_executor_pools(wait=True):
+    """
+    - shut down all pools created by get_executor_pool(); later calls create new ones
+    """
+    with _executor_pools_lock:
+        pools = list(_executor_pools.values())
+        _executor_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_SharedBuffer = collections.namedtuple('_SharedBuffer', 'name nbytes format shape')
+
+
+def _share_buffer(obj):
+    """
+    - copy a contiguous, non-empty buffer-like object, e.g., bytes or an array, into a new shared memory block
+    - return (block, handle), or (None, obj) if obj does not qualify; unpicklable memoryviews become bytes
+    - the creator owns the block: close() it after use; the consumer unlink()s it
+    """
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return None, obj
+    with view:
+        if not view.c_contiguous or not view.nbytes:
+            return None, view.tobytes() if isinstance(obj, memoryview) else obj
+        from multiprocessing import shared_memory
+        block = shared_memory.SharedMemory(create=True, size=view.nbytes)
+        block.buf[:view.nbytes] = view.cast('B')
+        return block, _SharedBuffer(block.name, view.nbytes, view.format, view.shape)
+
+
+def _release_shared_view(block, view):
+    # a view still exported by the worker, e.g., through numpy.frombuffer(), keeps the mapping alive until collected
+    try:
+        view.release()
+        block.close()
+    except BufferError:
+        pass
+
+
+def _run_concur_chunk(worker, chunk, shared=False, timed=False):
+    """
+    - run worker on a chunk of (index, elem) items as a single task
+    - return an outcome per item: (index, result, error, seconds); seconds is None unless timed
+    - capture failures per item, so that one bad item does not lose the rest of its chunk
+    - shared: elems may be _SharedBuffer handles, which the worker sees as memoryviews of the shared blocks;
+      buffer-like results travel back through new shared blocks
+    """
+    outcomes = []
+    for index, elem in chunk:
+        block = view = None
+        started = time.perf_counter() if timed else None
+        try:
+            if shared and isinstance(elem, _SharedBuffer):
+                from multiprocessing import shared_memory
+                block = shared_memory.SharedMemory(name=elem.name)
+                view = elem = block.buf[:elem.nbytes].cast(elem.format, elem.shape)
+            result = worker((index, elem))
+            if shared:
+                result_block, result = _share_buffer(result)
+                if result_block:
+                    result_block.close()
+            outcomes.append((index, result, None, time.perf_counter() - started if timed else None))
+        except Exception as e:
+            outcomes.append((index, None, e, time.perf_counter() - started if timed else None))
+        finally:
+            if block:
+                _release_shared_view(block, view)
+    return outcomes
+
+
+def _collect_shared_result(result):
+    """
+    - copy a result shared by a worker out of its block and free the block
+    """
+    if not isinstance(result, _SharedBuffer):
+        return result
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=result.name)
+    try:
+        return bytes(block.buf[:result.nbytes])
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _free_shared_blocks(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _free_abandoned_shared_results(futures):
+    """
+    - wait for tasks that could not be cancelled, then free the result blocks that nobody will consume
     """
+    from multiprocessing import shared_memory
+    for future in futures:
+        if future.cancelled() or future.exception() is not None:
+            continue
+        _free_shared_blocks([shared_memory.SharedMemory(name=result.name) for _, result, _, _ in future.result() if isinstance(result, _SharedBuffer)])
+
+
+def concur_imap(worker, coll, worker_count=None, iobound=True, logger=None, chunksize=1, max_inflight=None, ordered=True, on_error='raise', reuse_pool=False, shared_memory=False, tune_workers=False, progress=None):
+    """
+    - streaming version of concur_map(): a generator consuming coll lazily and yielding results as soon as they are ready
+    - map function interface: worker((index, elem)) -> processed_elem
+    - worker_count: 'auto' sizes the pool by usable CPUs, respecting affinity and cgroup quota; see get_usable_cpu_count()
+    - tune_workers: with iobound and 'auto', measure the first batch, then resize thread concurrency by how much tasks block
+    - chunksize: items per task; larger chunks amortize the inter-process round trip of cheap workers
+    - max_inflight: max tasks submitted but not yet consumed, bounding memory for huge or endless inputs; defaults to twice the workers
+    - ordered: yield results in input order; False yields (index, result) pairs in completion order
+    - on_error: policy for worker exceptions, per item
+      - 'raise': re-raise the first exception and cancel pending tasks
+      - 'collect': yield the exception in place of the result
+      - 'skip': drop the item
+    - closing the generator early cancels pending tasks
+    - progress: a ConcurProgress to collect throughput metrics and report to its callback; None costs nothing
+    - reuse_pool: run on a persistent pool from get_executor_pool() instead of a throwaway one
+    - shared_memory: for process pools, pass large buffers through multiprocessing.shared_memory instead of pickling them
+      - contiguous buffer-like elems, e.g., bytes or arrays, reach the worker as memoryviews with their original format and shape
+      - the views are only valid during the call; copy what must outlive it
+      - buffer-like results come back as bytes
+      - other elems and results are pickled as usual
+    """
+    import concurrent.futures
+    import itertools
+    if on_error not in ('raise', 'collect', 'skip'):
+        raise ValueError(f'Unsupported error policy: {on_error}; expected: raise, collect, skip')
     if not iobound:
         assert is_toplevel_function(worker), 'must use top-level function as multiprocessing worker'
-    max_workers = 10 if iobound else multiprocessing.cpu_count() - 1
-    n_workers = worker_count or max_workers
-    executor_class = concurrent.futures.ThreadPoolExecutor if iobound else concurrent.futures.ProcessPoolExecutor
+    n_workers = _concur_worker_count(iobound, worker_count)
+    samples = None
+    if tune_workers and iobound and worker_count == 'auto':
+        # probe with the default size; the pool only caps the threads, which start on demand
+        samples = []
+        n_inflight_cap = max_inflight or _MAX_TUNED_IO_THREADS
+        max_inflight = n_probes = min(n_workers, n_inflight_cap)
+        n_workers = _MAX_TUNED_IO_THREADS
+    max_inflight = max_inflight or 2 * n_workers
+    if reuse_pool:
+        executor_cm = contextlib.nullcontext(get_executor_pool(iobound, n_workers))
+    else:
+        executor_class = concurrent.futures.ThreadPoolExecutor if iobound else concurrent.futures.ProcessPoolExecutor
+        executor_cm = executor_class(max_workers=n_workers)
     if logger:
         logger.debug(f'Concurrently run task: {worker.__name__} on collection, using {n_workers} {"threads" if iobound else "processes"} ...')
-    with executor_class(max_workers=n_workers) as executor:
-        return list(executor.map(worker, enumerate(coll)))
+    shared = shared_memory and not iobound
+    timed = progress is not None
+    if progress:
+        progress.start(len(coll) if hasattr(coll, '__len__') else None)
+    items = enumerate(coll)
+    pending = collections.deque() if ordered else set()
+    # input blocks of the pending tasks, freed once their tasks finish
+    shared_blocks = {}
+    # tasks whose result blocks are not yet collected
+    uncollected = set()
+    with executor_cm as executor:
+        def _complete_progress(future):
+            # count as soon as the task is done, not when an ordered caller gets to it
+            outcomes = future.result() if not future.cancelled() and future.exception() is None else ()
+            progress.complete(future, outcomes)
+
+        def _top_up():
+            while len(pending) < max_inflight and (chunk := list(itertools.islice(items, chunksize))):
+                blocks = []
+                if shared:
+                    for c, (index, elem) in enumerate(chunk):
+                        block, handle = _share_buffer(elem)
+                        if block:
+                            blocks.append(block)
+                            chunk[c] = (index, handle)
+                future = executor.submit(_run_concur_chunk, worker, chunk, shared, timed) if samples is None else executor.submit(_run_sampled_concur_chunk, samples, worker, chunk, shared, timed)
+                if progress:
+                    progress.submit(future, chunk[0][0], len(chunk))
+                    future.add_done_callback(_complete_progress)
+                if blocks:
+                    shared_blocks[future] = blocks
+                if shared:
+                    uncollected.add(future)
+                pending.append(future) if ordered else pending.add(future)
+        try:
+            _top_up()
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    pending -= done
+                if samples is not None and len(samples) >= n_probes:
+                    max_inflight = min(n_inflight_cap, _tune_io_thread_count(samples, n_workers))
+                    samples = None
+                    if logger:
+                        logger.debug(f'Tuned concurrency of {worker.__name__} to {max_inflight} threads')
+                # keep workers busy while the caller consumes
+                _top_up()
+                for future in done:
+                    try:
+                        outcomes = future.result()
+                    finally:
+                        _free_shared_blocks(shared_blocks.pop(future, ()))
+                    if shared:
+                        # free all result blocks before the caller may stop consuming
+                        outcomes = [(index, _collect_shared_result(result), error, seconds) for index, result, error, seconds in outcomes]
+                        uncollected.discard(future)
+                    if progress:
+                        # in case the done-callback of the future has yet to run
+                        progress.complete(future, outcomes)
+                    for index, result, error, _ in outcomes:
+                        if error is not None:
+                            if on_error == 'raise':
+                                raise error
+                            if on_error == 'skip':
+                                continue
+                            result = error
+                        yield result if ordered else (index, result)
+        finally:
+            for future in pending:
+                future.cancel()
+            # a running task that loses its blocks fails to attach or keeps its mapping until done
+            for blocks in shared_blocks.values():
+                _free_shared_blocks(blocks)
+            # tasks that were running or done when the caller stopped still shared their results
+            _free_abandoned_shared_results(uncollected)
+            if progress:
+                progress.finish()
 
 
 def profile_runs(funcname, modulefile, nruns=5, outdir=None):
@@ -783,6 +2217,8 @@ def profile_runs(funcname, modulefile, nruns=5, outdir=None):
     - modulefile: script containing profileable wrapper functions
     - funcname: arg-less wrapper function that instantiate modules/functions as the actual profiling target
     """
+    import cProfile as profile
+    import pstats
     out_dir = outdir or osp.dirname(modulefile)
     module_name = osp.splitext(osp.basename(modulefile))[0]
     mod = safe_import_module(module_name, osp.dirname(modulefile))
@@ -804,12 +2240,14 @@ def profile_runs(funcname, modulefile, nruns=5, outdir=None):
 
 
 def load_plist(path, binary=False):
+    import plistlib
     fmt = plistlib.FMT_BINARY if binary else plistlib.FMT_XML
     with open(path, 'rb') as fp:
         return plistlib.load(fp, fmt=fmt)
 
 
 def save_plist(path, my_map, binary=False):
+    import plistlib
     fmt = plistlib.FMT_BINARY if binary else plistlib.FMT_XML
     par_dir = osp.dirname(path)
     os.makedirs(par_dir, exist_ok=True)
@@ -835,6 +2273,7 @@ def substitute_keywords(text, str_map, useliteral=False):
 
 
 def is_uuid(text, version: int = 0):
+    import uuid
     try:
         uuid_obj = uuid.UUID(text)
     except ValueError:
@@ -844,6 +2283,7 @@ def is_uuid(text, version: int = 0):
 
 
 def get_uuid_version(text):
+    import uuid
     try:
         uuid_obj = uuid.UUID(text)
     except ValueError:
@@ -853,6 +2293,7 @@ def get_uuid_version(text):
 
 
 def create_guid(uuid_version=4, uuid5_name=None):
+    import uuid
     if uuid_version not in [1, 4, 5]:
         return None
     if uuid_version == 5:
@@ -1021,6 +2462,7 @@ def init_translator(localedir, domain='all', langs=None):
       - Windows: refer to: https://learn.microsoft.com/en-us/windows-hardware/manufacture/desktop/available-language-packs-for-windows?view=windows-11
       - macOS: same as gettext
     """
+    import gettext
 
     def _get_locale_code(loc):
         locale_code_map = {
@@ -1061,7 +2503,36 @@ def match_files_except_lines(file1, file2, excluded=None):
     return content1 == content2
 
 
-def rerun_lock(name, folder=None, logger=glogger, max_instances=1):
+def _try_lock_fd(fd):
+    """
+    - take an exclusive, non-blocking OS advisory lock on an open file; False if held elsewhere
+    """
+    if PLATFORM == 'Windows':
+        import msvcrt
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    import fcntl
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _unlock_fd(fd):
+    if PLATFORM == 'Windows':
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        return
+    import fcntl
+    fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def rerun_lock(name, folder=None, logger=glogger, max_instances=1, backend='file', install_signal_handlers=True):
     """Decorator for reentrance locking on functions"""
 
     def decorator(f):
@@ -1069,7 +2540,7 @@ def rerun_lock(name, folder=None, logger=glogger, max_instances=1):
         def wrapper(*args, **kwargs):
             my_lock = None
             try:
-                my_lock = RerunLock(name, folder, logger, max_instances)
+                my_lock = RerunLock(name, folder, logger, max_instances, backend, install_signal_handlers)
                 if not my_lock.lock():
                     return 1
                 try:
@@ -1257,6 +2728,8 @@ def save_winreg_record(full_key, var, value, value_type=winreg.REG_EXPAND_SZ if
 
 def _log_subprocess_command(cmd, cwd, logger, func_name="subprocess"):
     """Helper function to log subprocess command consistently"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
     cmd_log = f"""\
 {func_name}:
 {' '.join(cmd)}
@@ -1264,6 +2737,29 @@ cwd: {osp.abspath(cwd) if cwd else os.getcwd()}"""
     logger.info(cmd_log)
 
 
+def _log_subprocess_output(output, title, logger, level, max_logged_bytes=None):
+    """
+    Helper function to log subprocess output only when level is enabled
+    - skip decoding altogether for disabled levels
+    - max_logged_bytes: cap huge outputs to a head/tail window of about that many bytes
+    """
+    if not output or not logger.isEnabledFor(level):
+        return
+    if isinstance(output, FileBackedOutput):
+        logger.log(level, f'{title}: streamed to {output.path} ({len(output)} bytes)')
+        return
+    if max_logged_bytes is not None and len(output) > max_logged_bytes:
+        half = max_logged_bytes // 2
+        skipped = len(output) - 2 * half
+        text = f"""\
+{safe_decode_bytes(output[:half]).rstrip()}
+... ({skipped} bytes skipped) ...
+{safe_decode_bytes(output[len(output) - half:]).lstrip()}"""
+    else:
+        text = safe_decode_bytes(output)
+    logger.log(level, f'{title}:\n{text.rstrip()}')
+
+
 def _log_subprocess_startup_error(e, cmd, logger, useexception=True):
     """Helper function to log subprocess startup errors with structured format"""
     error_type = type(e).__name__
@@ -1303,7 +2799,57 @@ def _log_subprocess_startup_error(e, cmd, logger, useexception=True):
     return types.SimpleNamespace(returncode=2, stdout='', stderr=safe_encode_text(str(e), encoding=LOCALE_CODEC))
 
 
-def run_cmd(cmd, cwd=None, logger=None, check=True, shell=False, verbose=False, useexception=True, env=None, hidedoswin=True):
+def _log_subprocess_exit_error(e, cmd, logger, useexception=True, max_logged_bytes=None):
+    """Helper function to log subprocess non-zero exits (CalledProcessError) with structured format"""
+    # Log subprocess output with clear separation
+    _log_subprocess_output(e.stdout, 'stdout', logger, logging.INFO, max_logged_bytes)
+    _log_subprocess_output(e.stderr, 'stderr', logger, logging.ERROR, max_logged_bytes)
+
+    # Log structured error message
+    situation = "Subprocess completed with non-zero exit code"
+    detail = [
+        f"Command: {' '.join(cmd)}",
+        f"Exit code: {e.returncode}",
+        f"Has stdout: {'Yes' if e.stdout else 'No'}",
+        f"Has stderr: {'Yes' if e.stderr else 'No'}"
+    ]
+    error_msg = format_log(situation, detail=detail)
+    logger.error(error_msg)
+
+    if useexception:
+        raise e
+    return types.SimpleNamespace(returncode=1, stdout=e.stdout, stderr=e.stderr)
+
+
+def _open_subprocess_sinks(stack, stdout_to=None, stderr_to=None):
+    """
+    Helper function to map output destinations to Popen's stdout/stderr args and lazy views
+    - None: PIPE, no view
+    - path: opened for writing within the ExitStack; both streams share the file if paths match
+    - binary file object: used as is
+    """
+    args, views = [], []
+    for sink in (stdout_to, stderr_to):
+        if sink is None:
+            args.append(subprocess.PIPE)
+            views.append(None)
+            continue
+        if not isinstance(sink, (str, os.PathLike)):
+            args.append(sink)
+            views.append(FileBackedOutput(osp.abspath(sink.name)))
+            continue
+        path = osp.abspath(sink)
+        if views and views[0] is not None and views[0].path == path:
+            args.append(subprocess.STDOUT)
+            views.append(views[0])
+            continue
+        os.makedirs(osp.dirname(path), exist_ok=True)
+        args.append(stack.enter_context(open(path, 'wb')))
+        views.append(FileBackedOutput(path))
+    return args, views
+
+
+def run_cmd(cmd, cwd=None, logger=None, check=True, shell=False, verbose=False, useexception=True, env=None, hidedoswin=True, max_logged_bytes=None, stdout_to=None, stderr_to=None):
     """
     Run a subprocess command and wait for completion.
 
@@ -1317,60 +2863,44 @@ def run_cmd(cmd, cwd=None, logger=None, check=True, shell=False, verbose=False,
         useexception: Whether to raise exceptions vs return error info (default: True)
         env: Environment variables (default: None)
         hidedoswin: Whether to hide DOS window on Windows (default: True)
+        max_logged_bytes: Cap on logged stdout/stderr each, logging a head/tail window beyond it (default: None, no cap)
+        stdout_to: File path or binary file object to stream stdout into, bypassing memory (default: None, capture in memory)
+        stderr_to: Same as stdout_to for stderr; the same path as stdout_to merges both streams (default: None)
 
     Returns:
         subprocess.CompletedProcess on success, or SimpleNamespace with error info
+        - streamed stdout/stderr come back as FileBackedOutput views
 
     Best practices:
         - Use useexception=False for optional commands that may fail
+        - Use stdout_to/stderr_to for commands producing huge outputs
         - Use verbose=True to see subprocess output in logs
         - Use shell=True only when needed (e.g., shell built-ins, complex commands)
         - Use check=False with useexception=False for commands where failure is expected
     """
     cmd = [comp if isinstance(comp, str) else str(comp) for comp in cmd]
     logger = logger or glogger
-    console_info = logger.info if logger and verbose else logger.debug
+    console_level = logging.INFO if verbose else logging.DEBUG
 
     # Log command execution
     _log_subprocess_command(cmd, cwd, logger, "run_cmd")
+    views = (None, None)
     try:
-        if hidedoswin and PLATFORM == 'Windows':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            proc = subprocess.run(cmd, check=check, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env, startupinfo=startupinfo)
-        else:
-            proc = subprocess.run(cmd, check=check, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env)
-        stdout_log = safe_decode_bytes(proc.stdout)
-        stderr_log = safe_decode_bytes(proc.stderr)
-        if stdout_log:
-            console_info(f'stdout:\n{stdout_log.rstrip()}')
-        if stderr_log:
-            logger.error(f'stderr:\n{stderr_log.rstrip()}')
+        with contextlib.ExitStack() as stack:
+            (stdout_arg, stderr_arg), views = _open_subprocess_sinks(stack, stdout_to, stderr_to)
+            if hidedoswin and PLATFORM == 'Windows':
+                startupinfo = subprocess.STARTUPINFO()
+                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+                proc = subprocess.run(cmd, check=check, shell=shell, stdout=stdout_arg, stderr=stderr_arg, cwd=cwd, env=env, startupinfo=startupinfo)
+            else:
+                proc = subprocess.run(cmd, check=check, shell=shell, stdout=stdout_arg, stderr=stderr_arg, cwd=cwd, env=env)
+        proc.stdout, proc.stderr = [view if view is not None else output for view, output in zip(views, (proc.stdout, proc.stderr))]
+        _log_subprocess_output(proc.stdout, 'stdout', logger, console_level, max_logged_bytes)
+        _log_subprocess_output(proc.stderr, 'stderr', logger, logging.ERROR, max_logged_bytes)
     # subprocess started but failed halfway: check=True, proc returns non-zero
     except subprocess.CalledProcessError as e:
-        stdout_log = safe_decode_bytes(e.stdout)
-        stderr_log = safe_decode_bytes(e.stderr)
-
-        # Log subprocess output with clear separation
-        if stdout_log:
-            logger.info(f'stdout:\n{stdout_log.rstrip()}')
-        if stderr_log:
-            logger.error(f'stderr:\n{stderr_log.rstrip()}')
-
-        # Log structured error message
-        situation = "Subprocess completed with non-zero exit code"
-        detail = [
-            f"Command: {' '.join(cmd)}",
-            f"Exit code: {e.returncode}",
-            f"Has stdout: {'Yes' if stdout_log else 'No'}",
-            f"Has stderr: {'Yes' if stderr_log else 'No'}"
-        ]
-        error_msg = format_log(situation, detail=detail)
-        logger.error(error_msg)
-
-        if useexception:
-            raise e
-        return types.SimpleNamespace(returncode=1, stdout=e.stdout, stderr=e.stderr)
+        e.stdout, e.stderr = [view if view is not None else output for view, output in zip(views, (e.stdout, e.stderr))]
+        return _log_subprocess_exit_error(e, cmd, logger, useexception, max_logged_bytes)
     # subprocess fails to start
     except Exception as e:
         return _log_subprocess_startup_error(e, cmd, logger, useexception)
@@ -1429,14 +2959,44 @@ def run_daemon(cmd, cwd=None, logger=None, shell=False, verbose=False, useexcept
         return _log_subprocess_startup_error(e, cmd, logger, useexception)
 
 
-def watch_cmd(cmd, cwd=None, logger=None, shell=False, verbose=False, useexception=True, prompt=None, timeout=None, env=None, hidedoswin=True):
+def _split_lines(text, final=False, max_pending=1 << 18):
     """
-    realtime output
+    Helper function to split decoded subprocess output into lines, keeping their line-ends
+    - returns the complete lines and the unterminated remainder to prepend to the next chunk
+    - a lone \r also ends a line, so that progress bars redrawing a line reach callbacks as they redraw
+      - a trailing \r is held back, because the next chunk may start with the \n of \r\n
+    - a remainder longer than max_pending is flushed as a line, which bounds both memory and the cost of re-joining it to each new chunk
     """
+    lines = []
+    start = 0
+    for match in re.finditer(r'\r\n|\r|\n', text):
+        if match.end() == len(text) and match.group() == '\r' and not final:
+            break
+        lines.append(text[start:match.end()])
+        start = match.end()
+    pending = text[start:]
+    if pending and (final or len(pending) > max_pending):
+        lines.append(pending)
+        pending = ''
+    return lines, pending
+
 
-    def read_stream(stream, output_queue):
-        for line in iter(stream.readline, b''):
-            output_queue.put(line)
+def watch_cmd(cmd, cwd=None, logger=None, shell=False, verbose=False, useexception=True, prompt=None, timeout=None, env=None, hidedoswin=True, on_stdout=None, on_stderr=None, keep_output=True, tail_lines=None):
+    """
+    realtime output
+    - reader threads push whatever chunk is available into a single queue, then signal EOF with None
+    - the caller thread blocks on that queue, so it costs no CPU while the child is idle
+    - on_stdout/on_stderr: callbacks receiving each decoded line with its line-end, instead of echoing chunks to sys.stdout/sys.stderr
+      - \r ends a line too, so progress bars arrive one redraw at a time
+    - keep_output: collect the whole output into the returned proc.stdout/proc.stderr
+      - set False to watch long-running processes in constant memory
+      - tail_lines: with keep_output=False, retain only the last N lines in proc.stdout/proc.stderr
+    """
+
+    def read_stream(stream, name, output_queue):
+        for chunk in iter(functools.partial(stream.read1, 65536), b''):
+            output_queue.put((name, chunk))
+        output_queue.put((name, None))
     cmd = [comp if isinstance(comp, str) else str(comp) for comp in cmd]
     logger = logger or glogger
 
@@ -1450,49 +3010,300 @@ def watch_cmd(cmd, cwd=None, logger=None, shell=False, verbose=False, useexcepti
             proc = subprocess.Popen(cmd, cwd=cwd, shell=shell, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, startupinfo=startupinfo)
         else:
             proc = subprocess.Popen(cmd, cwd=cwd, shell=shell, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-        stdout_queue, stderr_queue = queue.Queue(), queue.Queue()
+        output_queue = queue.Queue()
         # Start separate threads to read from stdout and stderr
-        stdout_thread = threading.Thread(target=read_stream, args=(proc.stdout, stdout_queue))
-        stderr_thread = threading.Thread(target=read_stream, args=(proc.stderr, stderr_queue))
-        stdout_thread.start()
-        stderr_thread.start()
-        res_stdout = []
-        res_stderr = []
+        readers = [threading.Thread(target=read_stream, args=(stream, name, output_queue)) for name, stream in (('stdout', proc.stdout), ('stderr', proc.stderr))]
+        for reader in readers:
+            reader.start()
+        sinks = {'stdout': sys.stdout, 'stderr': sys.stderr}
+        callbacks = {'stdout': on_stdout, 'stderr': on_stderr}
+        # chunks may split multibyte chars
+        decoders = {name: codecs.getincrementaldecoder(LOCALE_CODEC)(errors='backslashreplace') for name in sinks}
+        # whole output as chunks, or the last lines as a ring buffer
+        results = {name: [] if keep_output else collections.deque(maxlen=tail_lines or 0) for name in sinks}
+        pending = {name: '' for name in sinks}
         # Read and print stdout and stderr in real-time
-        while True:
-            try:
-                stdout_line = safe_decode_bytes(stdout_queue.get_nowait())
-                res_stdout.append(stdout_line)
-                sys.stdout.write(stdout_line)
-                sys.stdout.flush()
-            except queue.Empty:
-                pass
-            try:
-                stderr_line = safe_decode_bytes(stderr_queue.get_nowait())
-                res_stderr.append(stderr_line)
-                sys.stderr.write(stderr_line)
-                sys.stderr.flush()
-            except queue.Empty:
-                pass
-            if proc.poll() is not None and stdout_queue.empty() and stderr_queue.empty():
-                break
+        n_open_streams = len(readers)
+        while n_open_streams:
+            name, chunk = output_queue.get()
+            eof = chunk is None
+            n_open_streams -= eof
+            text = decoders[name].decode(chunk or b'', final=eof)
+            if keep_output:
+                results[name].append(text)
+            if (callback := callbacks[name]) is None:
+                sinks[name].write(text)
+                sinks[name].flush()
+                if keep_output:
+                    continue
+            # split into lines for callbacks and tail retention
+            lines, pending[name] = _split_lines(pending[name] + text, final=eof)
+            for line in lines:
+                if callback:
+                    callback(line)
+                if not keep_output:
+                    results[name].append(line)
         # Wait for the threads to finish
-        stdout_thread.join()
-        stderr_thread.join()
+        for reader in readers:
+            reader.join()
         # both are empty at this point
         stdout, stderr = proc.communicate()
-        proc.stdout, proc.stderr = safe_encode_text(''.join(res_stdout), encoding=LOCALE_CODEC), safe_encode_text(''.join(res_stderr), encoding=LOCALE_CODEC)
+        proc.stdout, proc.stderr = safe_encode_text(''.join(results['stdout']), encoding=LOCALE_CODEC), safe_encode_text(''.join(results['stderr']), encoding=LOCALE_CODEC)
         return proc
     # subprocess fails to start
     except Exception as e:
         return _log_subprocess_startup_error(e, cmd, logger, useexception)
 
 
+async def _acreate_subprocess(cmd, cwd=None, shell=False, env=None, hidedoswin=True, stdin=None):
+    """Helper function to start an asyncio subprocess with the same options as the blocking helpers"""
+    import asyncio
+    kwargs = {'stdin': stdin, 'stdout': asyncio.subprocess.PIPE, 'stderr': asyncio.subprocess.PIPE, 'cwd': cwd, 'env': env}
+    if hidedoswin and PLATFORM == 'Windows':
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        kwargs['startupinfo'] = startupinfo
+    if not shell:
+        return await asyncio.create_subprocess_exec(*cmd, **kwargs)
+    # same semantics as subprocess.Popen(cmd_list, shell=True)
+    if PLATFORM == 'Windows':
+        return await asyncio.create_subprocess_shell(subprocess.list2cmdline(cmd), **kwargs)
+    return await asyncio.create_subprocess_exec('/bin/sh', '-c', *cmd, **kwargs)
+
+
+async def _apump_lines(stream, callback, chunk_size=65536):
+    """
+    Helper function to feed decoded lines of an asyncio stream to an async callback
+    - chunked reads avoid StreamReader.readline()'s line-length limit
+    - lines keep their line-ends; the last line may have none
+    - split as in watch_cmd(): \r ends a line too, and an over-long unterminated line arrives in pieces
+    """
+    decoder = codecs.getincrementaldecoder(LOCALE_CODEC)(errors='backslashreplace')
+    pending = ''
+    while chunk := await stream.read(chunk_size):
+        lines, pending = _split_lines(pending + decoder.decode(chunk))
+        for line in lines:
+            await callback(line)
+    lines, _ = _split_lines(pending + decoder.decode(b'', final=True), final=True)
+    for line in lines:
+        await callback(line)
+
+
+async def arun_cmd(cmd, cwd=None, logger=None, check=True, shell=False, verbose=False, useexception=True, env=None, hidedoswin=True, max_logged_bytes=None):
+    """
+    asyncio version of run_cmd(), sharing its arguments, logging and error handling
+
+    Returns:
+        subprocess.CompletedProcess on success, or SimpleNamespace with error info
+
+    Note:
+        Cancelling the awaiting task, e.g., by asyncio.wait_for(), kills the subprocess
+    """
+    import asyncio
+    cmd = [comp if isinstance(comp, str) else str(comp) for comp in cmd]
+    logger = logger or glogger
+    console_level = logging.INFO if verbose else logging.DEBUG
+    _log_subprocess_command(cmd, cwd, logger, "arun_cmd")
+    try:
+        aproc = await _acreate_subprocess(cmd, cwd, shell, env, hidedoswin)
+    # subprocess fails to start
+    except Exception as e:
+        return _log_subprocess_startup_error(e, cmd, logger, useexception)
+    try:
+        stdout, stderr = await aproc.communicate()
+    except asyncio.CancelledError:
+        aproc.kill()
+        await aproc.wait()
+        raise
+    proc = subprocess.CompletedProcess(cmd, aproc.returncode, stdout, stderr)
+    # subprocess started but failed halfway: check=True, proc returns non-zero
+    if check and proc.returncode != 0:
+        return _log_subprocess_exit_error(subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr), cmd, logger, useexception, max_logged_bytes)
+    _log_subprocess_output(proc.stdout, 'stdout', logger, console_level, max_logged_bytes)
+    _log_subprocess_output(proc.stderr, 'stderr', logger, logging.ERROR, max_logged_bytes)
+    return proc
+
+
+async def arun_daemon(cmd, cwd=None, logger=None, shell=False, verbose=False, useexception=True, env=None, hidedoswin=True):
+    """
+    asyncio version of run_daemon(), sharing its arguments, logging and error handling
+
+    Returns:
+        asyncio.subprocess.Process on success, or SimpleNamespace with error info
+        - await proc.communicate() or proc.wait() to get final results
+    """
+    cmd = [comp if isinstance(comp, str) else str(comp) for comp in cmd]
+    logger = logger or glogger
+    log_func = logger.info if verbose else logger.debug
+    _log_subprocess_command(cmd, cwd, logger, "arun_daemon")
+    try:
+        proc = await _acreate_subprocess(cmd, cwd, shell, env, hidedoswin)
+    # subprocess fails to start
+    except Exception as e:
+        return _log_subprocess_startup_error(e, cmd, logger, useexception)
+    log_func(f"Background process started successfully (PID: {proc.pid})")
+    return proc
+
+
+async def awatch_cmd(cmd, cwd=None, logger=None, shell=False, verbose=False, useexception=True, env=None, hidedoswin=True, on_stdout=None, on_stderr=None, keep_output=True, tail_lines=None):
+    """
+    asyncio version of watch_cmd(), sharing its arguments, logging and error handling
+    - on_stdout/on_stderr: async callbacks receiving each decoded line with its line-end
+      - default to echoing lines to sys.stdout/sys.stderr
+    - like watch_cmd(), the returned process carries the whole output as bytes in .stdout/.stderr
+      - keep_output=False with tail_lines=N retains only the last N lines instead
+    - cancelling the awaiting task kills the subprocess
+
+    Returns:
+        asyncio.subprocess.Process on success, or SimpleNamespace with error info
+    """
+    import asyncio
+
+    def _make_echo(sink):
+        async def _echo(line):
+            sink.write(line)
+            sink.flush()
+        return _echo
+
+    def _make_collector(lines, callback):
+        async def _collect(line):
+            lines.append(line)
+            await callback(line)
+        return _collect
+
+    cmd = [comp if isinstance(comp, str) else str(comp) for comp in cmd]
+    logger = logger or glogger
+    _log_subprocess_command(cmd, cwd, logger, "awatch_cmd")
+    try:
+        proc = await _acreate_subprocess(cmd, cwd, shell, env, hidedoswin, stdin=asyncio.subprocess.PIPE)
+    # subprocess fails to start
+    except Exception as e:
+        return _log_subprocess_startup_error(e, cmd, logger, useexception)
+    res_stdout, res_stderr = ([] if keep_output else collections.deque(maxlen=tail_lines or 0) for _ in range(2))
+    try:
+        await asyncio.gather(
+            _apump_lines(proc.stdout, _make_collector(res_stdout, on_stdout or _make_echo(sys.stdout))),
+            _apump_lines(proc.stderr, _make_collector(res_stderr, on_stderr or _make_echo(sys.stderr))),
+        )
+        proc.stdin.close()
+        await proc.wait()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    proc.stdout, proc.stderr = safe_encode_text(''.join(res_stdout), encoding=LOCALE_CODEC), safe_encode_text(''.join(res_stderr), encoding=LOCALE_CODEC)
+    return proc
+
+
+def run_cmds(cmds, max_parallel=None, fail_fast=False, timeout=None, cwd=None, logger=None, shell=False, env=None, hidedoswin=True, stats=None):
+    """
+    Run many subprocess commands with bounded concurrency, yielding results as they complete.
+
+    Args:
+        cmds: Iterable of command lists, consumed lazily as slots free up
+        max_parallel: Max number of running subprocesses (default: CPU count)
+        fail_fast: Whether to kill running commands and skip pending ones after the first failure (default: False)
+        timeout: Per-command timeout in seconds; overdue commands get killed (default: None)
+        cwd, logger, shell, env, hidedoswin: Same as run_cmd(), shared by all commands
+        stats: Optional SimpleNamespace receiving aggregate timing stats once the batch ends
+
+    Yields:
+        SimpleNamespace(index, cmd, returncode, stdout, stderr, elapsed, timedout) in completion order
+
+    Best practices:
+        - Consume the generator to drive the batch; breaking out of it kills the running commands
+        - Check result.returncode, as failures never raise here
+
+    Note:
+        A single asyncio event loop in the calling thread drives all subprocesses, so no worker thread is spawned per command.
+    """
+    import asyncio
+    logger = logger or glogger
+    n_parallel = max_parallel or get_usable_cpu_count()
+
+    async def _run_one(index, cmd):
+        cmd = [comp if isinstance(comp, str) else str(comp) for comp in cmd]
+        _log_subprocess_command(cmd, cwd, logger, "run_cmds")
+        start = time.perf_counter()
+        try:
+            proc = await _acreate_subprocess(cmd, cwd, shell, env, hidedoswin)
+        except Exception as e:
+            res = _log_subprocess_startup_error(e, cmd, logger, useexception=False)
+            return types.SimpleNamespace(index=index, cmd=cmd, returncode=res.returncode, stdout=res.stdout, stderr=res.stderr, elapsed=time.perf_counter() - start, timedout=False)
+        timedout = False
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            timedout = True
+            proc.kill()
+            stdout, stderr = await proc.communicate()
+            logger.error(format_log(f'Subprocess timed out after {timeout} seconds and got killed', detail=[f"Command: {' '.join(cmd)}"]))
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.wait()
+            raise
+        res = types.SimpleNamespace(index=index, cmd=cmd, returncode=proc.returncode, stdout=stdout, stderr=stderr, elapsed=time.perf_counter() - start, timedout=timedout)
+        if res.returncode != 0 and not timedout:
+            _log_subprocess_exit_error(subprocess.CalledProcessError(res.returncode, cmd, stdout, stderr), cmd, logger, useexception=False)
+        else:
+            _log_subprocess_output(stdout, 'stdout', logger, logging.DEBUG)
+            _log_subprocess_output(stderr, 'stderr', logger, logging.ERROR)
+        return res
+
+    loop = asyncio.new_event_loop()
+    pending = set()
+    cmd_iter = enumerate(cmds)
+    elapsed_all = []
+    n_failed = n_timedout = 0
+    stopping = False
+    batch_start = time.perf_counter()
+    try:
+        while True:
+            while not stopping and len(pending) < n_parallel and (item := next(cmd_iter, None)) is not None:
+                pending.add(loop.create_task(_run_one(*item)))
+            if not pending:
+                break
+            done, pending = loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+            for task in sorted(done, key=lambda t: t.result().index):
+                res = task.result()
+                elapsed_all.append(res.elapsed)
+                n_failed += res.returncode != 0
+                n_timedout += res.timedout
+                stopping = stopping or (fail_fast and res.returncode != 0)
+                yield res
+            if stopping and pending:
+                logger.warning(f'run_cmds: fail-fast: killing {len(pending)} running command(s) and skipping the rest')
+                for task in pending:
+                    task.cancel()
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                pending = set()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+        wall_sec = time.perf_counter() - batch_start
+        batch_stats = types.SimpleNamespace(
+            count=len(elapsed_all),
+            failed=n_failed,
+            timedout=n_timedout,
+            wallSec=wall_sec,
+            totalSec=sum(elapsed_all),
+            meanSec=sum(elapsed_all) / len(elapsed_all) if elapsed_all else 0.0,
+            maxSec=max(elapsed_all, default=0.0),
+        )
+        if stats is not None:
+            merge_namespaces(stats, batch_stats)
+        logger.info(format_log('run_cmds: batch ended', detail=[f'{key}: {value}' for key, value in vars(batch_stats).items()]))
+
+
 def extract_call_args(file, caller, callee):
     """
     - only support literal args
     - will throw if an arg value is a function call itself
     """
+    import ast
 
     def _get_arg_value(argument):
         """
@@ -1569,6 +3380,7 @@ def extract_class_attributes(file, classname):
     - builtin types of attributes without taa can be inferred from constant values
     - type-annotation can use built-in primitive types, typed-collection, and typing.TypeVar
     """
+    import ast
 
     def _get_attr_by_type(node):
         is_type_annotated = isinstance(node, ast.AnnAssign)
@@ -1638,6 +3450,7 @@ def extract_local_var_assignments(file, caller, varname):
     """
     - only support literal assignments (var_name = literal_value)
     """
+    import ast
     import inspect
     mod_name = osp.splitext(osp.basename(file))[0]
     mod = safe_import_module(mod_name, osp.dirname(file))
@@ -1661,6 +3474,7 @@ def extract_local_var_assignments(file, caller, varname):
 
 
 def extract_imported_modules(file):
+    import ast
     def _get_import_aliases(importmod):
         return [alias.name for alias in importmod.names]
 
@@ -1692,6 +3506,7 @@ def extract_sourcecode_comments(file):
     """
     comments = {"(row, col)": "# ...."}
     """
+    import tokenize
     with open(file) as fp:
         comments = {str(start): tok for toktype, tok, start, end, line in tokenize.generate_tokens(fp.readline) if toktype == tokenize.COMMENT}
     return comments
@@ -1942,6 +3757,7 @@ def compare_textfiles(file1, file2, showdiff=False, contextonly=True, ignoredlin
     """
     - ignoredlinenos: 0-based
     """
+    import difflib
     logger = logger or glogger
     with open(file1) as fp1, open(file2) as fp2:
         lines1 = fp1.readlines()
@@ -2200,6 +4016,7 @@ def compare_dirs(dir1, dir2, ignoreddirpatterns=(), ignoredfilepatterns=(), show
     - filecmp.dircmp() supports explicit name ignores only
     - this function supports glob-pattern ignores
     """
+    import pprint as pp
 
     def _collect_folders_files(my_dir):
         my_dir_contents = {
@@ -2484,7 +4301,7 @@ def show_results(succeeded, detail, advice, dryrun=False):
     return report
 
 
-def init_repo(srcfile_or_dir, appdepth=2, repodepth=3, organization='mycompany', logname=None, verbose=False, uselocale=False):
+def init_repo(srcfile_or_dir, appdepth=2, repodepth=3, organization='mycompany', logname=None, verbose=False, uselocale=False, logrotation=None):
     """
     help source-file refer to its project-tree and utilities
     - based on a 3-level folder structure: repo > app > sub-dirs
@@ -2493,6 +4310,7 @@ def init_repo(srcfile_or_dir, appdepth=2, repodepth=3, organization='mycompany',
     - deeper files such as test-case files may tweak appdepth and repodepth for pointing to a correct tree-level
     - set flag uselocale to use gettext localization, by using _T() function around non-fstrings
     - set verbose to show debug log in console
+    - set logrotation to rotate the app log file, refer to build_default_logger()
     - set inter-app sharable tmp folder to platform_cache > organization > app
     """
     assert appdepth <= repodepth
@@ -2505,7 +4323,7 @@ def init_repo(srcfile_or_dir, appdepth=2, repodepth=3, organization='mycompany',
     app.locDir, app.srcDir, app.tmpDir, app.testDir = get_child_dirs(app_root := app.ancestorDirs[appdepth - 1], subs=('locale', 'src', 'temp', 'test'))
     app.pubTmpDir = osp.join(get_platform_tmp_dir(), organization, osp.basename(app_root))
     app.stem = osp.splitext(osp.basename(srcfile_or_dir))[0]
-    app.logger = build_default_logger(app.tmpDir, name=logname if logname else app.stem, verbose=verbose)
+    app.logger = build_default_logger(app.tmpDir, name=logname if logname else app.stem, verbose=verbose, rotation=logrotation)
     if uselocale:
         app.translator = init_translator(app.locDir)
     return app
@@ -2970,6 +4788,7 @@ def extract_docstring(path, target=None, encoding=TXT_CODEC, envelope=None):
     TODO:
     - support class/method/function-level docstrings
     """
+    import ast
     def _extract_nonpy_docstring(code, target, envelope):
         lines = code.splitlines()
         start_ln = find_first_line_in_range(lines, envelope)
@@ -3026,6 +4845,7 @@ def load_dsv(path, delimiter=',', encoding=TXT_CODEC):
     TODO:
     - support csv's dialect
     """
+    import csv
     avoid_extra_blankline_on_win = '' if PLATFORM == 'Windows' else None
     with open(path, newline=avoid_extra_blankline_on_win, encoding=encoding) as fp:
         reader = csv.reader(fp, delimiter=delimiter, skipinitialspace=True)
@@ -3037,6 +4857,7 @@ def save_dsv(path, rows, delimiter=',', encoding=TXT_CODEC):
     """
     - strip of leading and trailing spaces for each row
     """
+    import csv
     avoid_extra_blankline_on_win = '' if PLATFORM == 'Windows' else None
     os.makedirs(osp.dirname(path), exist_ok=True)
     with open(path, 'w', newline=avoid_extra_blankline_on_win, encoding=encoding) as fp:
@@ -3068,12 +4889,14 @@ def say(text, voice='Samantha', outfile=None):
 
 
 def http_get(url, encoding=TXT_CODEC):
+    import urllib.request
     with urllib.request.urlopen(url) as response:
         html = response.read()
     return safe_decode_bytes(html, encoding=encoding)
 
 
 def http_post(url, data: dict, encoding=TXT_CODEC):
+    import urllib.request
     encoded = json.dumps(data).encode(encoding)
     req = urllib.request.Request(url, headers={'Content-Type': 'application/json'})
     with urllib.request.urlopen(req, encoded) as response:
@@ -3086,6 +4909,7 @@ def http_post(url, data: dict, encoding=TXT_CODEC):
 
 
 def lazy_download(local_file, url, file_open_mode='wb', logger=None):
+    import urllib.request
     if osp.isfile(local_file):
         return local_file
     os.makedirs(osp.dirname(local_file), exist_ok=True)
@@ -3148,6 +4972,7 @@ def format_now(dt=datetime.datetime.now(), fmt='%Y_%m_%d-%H_%M_%S'):
 
 
 def load_ini(path, *args, **kwargs):
+    import configparser
     config = configparser.ConfigParser(*args, **kwargs)
     config.read(path)
     return config
@@ -3177,31 +5002,97 @@ def merge_namespaces(to_ns: types.SimpleNamespace, from_ns: types.SimpleNamespac
     return to_ns
 
 
-def thread_timeout(seconds, bypass=False):
+_thread_timeout_executor = None
+_thread_timeout_orphans = {}
+_thread_timeout_lock = threading.Lock()
+
+
+def _get_thread_timeout_executor(max_workers=None):
+    """
+    - shared by all thread_timeout() functions, so that runaway calls cannot leak threads without bound
+    - max_workers only takes effect on first use
+    - orphans do not count against max_workers: the pool grows by one per live orphan, so that hung calls cannot starve other functions
+    """
+    global _thread_timeout_executor
+    with _thread_timeout_lock:
+        if _thread_timeout_executor is None:
+            import concurrent.futures
+            _thread_timeout_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thread_timeout')
+        return _thread_timeout_executor
+
+
+def get_thread_timeout_orphans():
+    """
+    - list timed-out calls still running in the shared thread_timeout() executor
+    - each item: namespace(name, started, token); token is None for non-cancellable functions
+    - orphans occupy workers until they return, so a growing list means functions ignore their tokens or are not cancellable
+    """
+    with _thread_timeout_lock:
+        return list(_thread_timeout_orphans.values())
+
+
+def thread_timeout(seconds, bypass=False, cancellable=False, executor=None, logger=None):
     """
+    - run the decorated function in a worker thread; return its result or re-raise its exception
+    - raise TimeoutError if it runs over; the time spent queuing for a busy worker counts
     - for single-process function only
     - will not work if decorated function spawns subprocesses
+    - cancellable: pass a CancellationToken as keyword argument cancel_token, cancelled on timeout
+    - executor: a concurrent.futures.Executor; None uses a bounded one shared by all decorated functions
+    - a timed-out call keeps running as an orphan until it returns; see get_thread_timeout_orphans()
     """
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             if bypass:
                 return func(*args, **kwargs)
-            # Create a thread to run the function
-            thread = threading.Thread(target=func, args=args, kwargs=kwargs)
-            thread.start()
-            # Wait for the thread to finish or timeout
-            thread.join(seconds)
-            if thread.is_alive():
-                # Terminate the thread if it's still running
-                raise TimeoutError(f"{func.__name__} timed out after {seconds} seconds")
+            import concurrent.futures
+            token = None
+            if cancellable:
+                token = kwargs['cancel_token'] = CancellationToken()
+            started = time.time()
+            pool = executor or _get_thread_timeout_executor()
+            future = pool.submit(func, *args, **kwargs)
+            try:
+                return future.result(timeout=seconds)
+            except concurrent.futures.TimeoutError:
+                pass
+            if token:
+                token.cancel()
+            # never started: nothing is left behind
+            if not future.cancel():
+                with _thread_timeout_lock:
+                    _thread_timeout_orphans[future] = types.SimpleNamespace(name=func.__qualname__, started=started, token=token)
+                    n_orphans = len(_thread_timeout_orphans)
+                    if pool is _thread_timeout_executor:
+                        # ThreadPoolExecutor spawns threads on submit while below this cap
+                        pool._max_workers += 1
+                future.add_done_callback(functools.partial(_discard_thread_timeout_orphan, pool))
+                (logger or glogger).warning(f'{func.__qualname__} timed out after {seconds} seconds and keeps running; orphans: {n_orphans}')
+            raise TimeoutError(f"{func.__qualname__} timed out after {seconds} seconds")
         return wrapper
     return decorator
 
 
+def _discard_thread_timeout_orphan(pool, future):
+    with _thread_timeout_lock:
+        _thread_timeout_orphans.pop(future, None)
+        if pool is _thread_timeout_executor:
+            pool._max_workers -= 1
+
+
+def _resolve_function(func_name):
+    """
+    - import a top-level function by its qualified name, e.g., in a child process
+    - unwrap functions decorated by process_timeout(), so that the child does not spawn again
+    """
+    module_name, func_name = func_name.rsplit('.', 1)
+    func = getattr(importlib.import_module(module_name), func_name)
+    return getattr(func, '__wrapped__', func)
+
+
 def _run_container(func, cont_queue, args, kwargs):
-    module_name, func_name = func.rsplit('.', 1)
-    module = importlib.import_module(module_name)
-    func = getattr(module, func_name)
+    func = _resolve_function(func)
     try:
         result = func(*args, **kwargs)
         cont_queue.put(result)
@@ -3209,13 +5100,41 @@ def _run_container(func, cont_queue, args, kwargs):
         cont_queue.put(e)
 
 
-def process_timeout(seconds, bypass=False):
+def _run_pool_worker(conn):
+    """
+    - serve (func_name, args, kwargs) calls from conn until receiving None
+    - resolved functions are cached for the worker's lifetime
+    - forked workers may inherit handlers, e.g., from RerunLock, that swallow SIGTERM; restore the default so that terminate() works
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    funcs = {}
+    while (task := conn.recv()) is not None:
+        func_name, args, kwargs = task
+        try:
+            if (func := funcs.get(func_name)) is None:
+                func = funcs[func_name] = _resolve_function(func_name)
+            result = func(*args, **kwargs)
+        except Exception as e:
+            result = e
+        conn.send(result)
+
+
+def process_timeout(seconds, bypass=False, pool=None):
+    """
+    - run the decorated top-level function in a child process; raise TimeoutError if it runs over
+    - pool: a TimeoutProcessPool to reuse warm workers; None spawns a process per call
+    - like the per-call mode, exceptions raised by the function are returned instead of raised
+    """
+    import multiprocessing
     def decorator(func):
         func_name = f'{func.__module__}.{func.__name__}'
 
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             if bypass:
                 return func(*args, **kwargs)
+            if pool is not None:
+                return pool.run(func_name, args, kwargs, seconds)
             # Create a thread to run the function
             cont_queue = multiprocessing.Queue()
             proc = multiprocessing.Process(target=_run_container, args=(func_name, cont_queue, args,), kwargs=kwargs)
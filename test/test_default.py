@@ -5,7 +5,9 @@ import copy
 import datetime
 import getpass
 import glob
+import itertools
 import json
+import logging
 import math
 import platform
 import shutil
@@ -38,6 +40,32 @@ _skip_slow_tests = osp.isfile(osp.join(_case_dir, 'skip_slow_tests.cfg.txt'))
 _skip_reason = 'tests requires long network or file i/o are temporarily skipped during tdd'
 
 
+def test_import_time_budget():
+    """
+    - heavy stdlib modules and the default logger must stay unloaded until first use
+    - budget is generous to absorb cold bytecode compilation on CI
+    """
+    budget_sec = 1.0
+    heavy_mods = ['ast', 'cProfile', 'pstats', 'csv', 'difflib', 'gettext', 'plistlib', 'urllib.request', 'multiprocessing', 'concurrent.futures', 'logging.config', 'hashlib', 'uuid']
+    code = f"""\
+import sys, time
+sys.path.insert(0, {repr(repo_root)})
+start = time.perf_counter()
+import kkpyutil
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(','.join(mod for mod in {heavy_mods} if mod in sys.modules))
+print(not kkpyutil.glogger.materialized)
+print(sys.excepthook is sys.__excepthook__)
+"""
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    elapsed, loaded, logger_deferred, hook_untouched = proc.stdout.splitlines()
+    assert float(elapsed) < budget_sec
+    assert loaded == ''
+    assert logger_deferred == 'True'
+    assert hook_untouched == 'True'
+
+
 def test_singletion_decorator():
     class MyClass:
         def __init__(self, n, s):
@@ -135,10 +163,138 @@ def test_build_default_logger():
     os.remove(log_file)
 
 
+def test_build_default_logger_async():
+    log_dir = osp.join(_gen_dir, 'async_logger')
+    logger = util.build_default_logger(log_dir, name='my_async', async_io=True, queue_size=8)
+    for i in range(100):
+        logger.debug(f'record {i}')
+    util.flush_logger(logger)
+    log_file = osp.join(log_dir, 'my_async.log')
+    assert util.find_log_path(logger) == log_file
+    assert 'record 99' in util.load_text(log_file)
+    listener = logger.handlers[0].listener
+    util.shutdown_logger(logger)
+    assert listener not in util._async_log_listeners
+    util.safe_remove(_gen_dir)
+
+
+def test_build_default_logger_rotation():
+    import gzip
+    log_dir = osp.join(_gen_dir, 'rotated_logger')
+    logger = util.build_default_logger(log_dir, name='my_rotated', rotation={'maxBytes': 256, 'backupCount': 2, 'compress': True})
+    for i in range(20):
+        logger.debug(f'record {i}')
+    file_handler = next(hdl for hdl in logger.handlers if isinstance(hdl, logging.FileHandler))
+    file_handler.rotator.join()
+    log_file = osp.join(log_dir, 'my_rotated.log')
+    assert sorted(osp.basename(file) for file in glob.glob(f'{log_file}*')) == ['my_rotated.log', 'my_rotated.log.1.gz', 'my_rotated.log.2.gz']
+    with gzip.open(f'{log_file}.1.gz', 'rt') as fp:
+        assert 'record' in fp.read()
+    util.shutdown_logger(logger)
+    logger = util.build_default_logger(log_dir, name='my_timed', rotation={'when': 'midnight', 'backupCount': 7})
+    file_handler = next(hdl for hdl in logger.handlers if isinstance(hdl, logging.FileHandler))
+    assert file_handler.when == 'MIDNIGHT'
+    util.shutdown_logger(logger)
+    util.safe_remove(_gen_dir)
+
+
+def test_build_default_logger_jsonl():
+    log_dir = osp.join(_gen_dir, 'jsonl_logger')
+    logger = util.build_default_logger(log_dir, name='my_jsonl', jsonl=True)
+    logger.debug('hello %s', 'json', extra={'user': 'me', 'obj': object})
+    try:
+        raise ValueError('oops')
+    except ValueError:
+        logger.exception('caught')
+    util.shutdown_logger(logger)
+    first, second = [json.loads(line) for line in util.load_lines(osp.join(log_dir, 'my_jsonl.log'), rmlineend=True)]
+    assert list(first) == ['time', 'level', 'module', 'lineno', 'message', 'user', 'obj']
+    assert first['level'] == 'DEBUG'
+    assert first['module'] == 'test_default'
+    assert first['message'] == 'hello json'
+    assert first['user'] == 'me'
+    assert first['obj'] == repr(object)
+    assert second['level'] == 'ERROR'
+    assert 'ValueError: oops' in second['exc_info']
+    # tracebacks survive the queue of async_io
+    logger = util.build_default_logger(log_dir, name='my_async_jsonl', jsonl=True, async_io=True)
+    try:
+        raise ValueError('oops')
+    except ValueError:
+        logger.exception('caught')
+    util.shutdown_logger(logger)
+    record = json.loads(util.load_text(osp.join(log_dir, 'my_async_jsonl.log')))
+    assert record['message'] == 'caught'
+    assert 'ValueError: oops' in record['exc_info']
+    util.safe_remove(_gen_dir)
+
+
+def test_bounded_log_queue():
+    def _make_record(level, msg):
+        return logging.LogRecord('test', level, __file__, 0, msg, None, None)
+
+    q = util.BoundedLogQueue(maxsize=2, overflow='drop_oldest')
+    for m in range(3):
+        q.put_nowait(_make_record(logging.INFO, m))
+    assert [q.get().msg for _ in range(2)] == [1, 2]
+    assert q.nDropped == 1
+    q = util.BoundedLogQueue(maxsize=2, overflow='drop_debug')
+    for m in range(2):
+        q.put_nowait(_make_record(logging.INFO, m))
+    q.put_nowait(_make_record(logging.DEBUG, 'dropped'))
+    assert q.nDropped == 1
+    assert q.qsize() == 2
+
+
+def test_lazy_logger():
+    log_dir = osp.join(_gen_dir, 'lazy_logger')
+    log_file = osp.join(log_dir, 'lazy.log')
+    util.safe_remove(log_dir)
+    logger = util.LazyLogger(lambda: util.build_default_logger(log_dir, name='lazy'), level=logging.INFO)
+    assert not logger.isEnabledFor(logging.DEBUG)
+    logger.debug('dropped before materializing')
+    assert not logger.materialized
+    assert not osp.exists(log_dir)
+    logger.info('hello lazy logger')
+    assert logger.materialized
+    assert osp.isfile(log_file)
+    assert util.find_log_path(logger) == osp.abspath(log_file)
+    # records point to caller instead of proxy
+    with um.patch.object(logging.Logger, 'handle') as mock_handle:
+        logger.warning('where am i')
+        assert mock_handle.call_args[0][0].funcName == 'test_lazy_logger'
+    for hdl in logger.handlers:
+        hdl.close()
+    util.safe_remove(_gen_dir)
+
+
+def test_lazy_glogger_keeps_app_logging():
+    log_dir = osp.join(_gen_dir, 'app_logger')
+    app_logger = util.build_default_logger(log_dir, name='app')
+    # glogger built after the app's logging config
+    util_logger = util.LazyLogger(util._build_glogger)
+    util_logger.info('first util record')
+    assert util_logger.materialized
+    logging.getLogger('thirdparty').warning('third-party record')
+    util.flush_logger(logging.getLogger())
+    assert 'third-party record' in util.load_text(osp.join(log_dir, 'app.log'))
+    assert util.find_log_path(util_logger) == osp.join(util.get_platform_tmp_dir(), '_util', 'util.log')
+    util.shutdown_logger(app_logger)
+    util.safe_remove(_gen_dir)
+
+
 def test_catch_unknown_exception():
     util.catch_unknown_exception(RuntimeError, 'exception info', None)
 
 
+def test_install_excepthook():
+    prev_hook = util.install_excepthook()
+    try:
+        assert sys.excepthook is util.catch_unknown_exception
+    finally:
+        sys.excepthook = prev_hook
+
+
 def test_format_brief():
     got = util.format_brief(
         title='title',
@@ -322,6 +478,175 @@ def test_concur_map():
     res = util.concur_map(map_worker, data, worker_count=5, iobound=False, logger=logger)
     assert res == [i * 2 for i in range(n)]
     shutil.rmtree(_gen_dir, ignore_errors=True)
+    # a slow head item does not stall the other workers
+    start = time.perf_counter()
+    res = util.concur_map(lambda enum: time.sleep(1.0 if enum[0] == 0 else 0.1) or enum[1], range(31), worker_count=4)
+    assert res == list(range(31))
+    assert time.perf_counter() - start < 1.3
+
+
+def test_concur_imap():
+    def halve(enum):
+        i, elem = enum
+        if elem % 2:
+            raise ValueError(f'odd: {elem}')
+        return elem // 2
+
+    # lazy over endless input, with bounded in-flight work
+    consumed = []
+    def _endless():
+        for i in itertools.count():
+            consumed.append(i)
+            yield i * 2
+    results = util.concur_imap(halve, _endless(), worker_count=2, max_inflight=4)
+    assert [next(results) for _ in range(10)] == list(range(10))
+    results.close()
+    assert len(consumed) <= 10 + 4
+    data = list(range(10))
+    assert list(util.concur_imap(halve, data, on_error='skip')) == [0, 1, 2, 3, 4]
+    collected = list(util.concur_imap(halve, data, on_error='collect'))
+    assert collected[::2] == [0, 1, 2, 3, 4]
+    assert all(isinstance(e, ValueError) for e in collected[1::2])
+    with pytest.raises(ValueError):
+        list(util.concur_imap(halve, data))
+    with pytest.raises(ValueError):
+        list(util.concur_imap(halve, data, on_error='ignore'))
+    unordered = list(util.concur_imap(map_worker, data, worker_count=2, iobound=False, chunksize=3, ordered=False))
+    assert sorted(unordered) == [(i, i * 2) for i in data]
+
+
+def shared_buffer_worker(enum):
+    i, elem = enum
+    if isinstance(elem, memoryview):
+        if elem.format == 'd':
+            return sum(elem)
+        # echo through shared memory
+        return elem
+    if elem is None:
+        raise ValueError('no buffer')
+    return elem
+
+
+def test_concur_imap_shared_memory():
+    import array
+    data = [b'abc' * 1000, array.array('d', [0.5, 1.5, 2.0]), 'not a buffer', b'', None]
+    results = list(util.concur_imap(shared_buffer_worker, data, worker_count=2, iobound=False, chunksize=2, shared_memory=True, on_error='collect'))
+    assert results[:4] == [b'abc' * 1000, 4.0, 'not a buffer', b'']
+    assert isinstance(results[4], ValueError)
+    # blocks are freed even when the caller stops early
+    prev_blocks = set(glob.glob('/dev/shm/psm_*'))
+    results = util.concur_imap(shared_buffer_worker, [b'x' * 100] * 10, worker_count=2, iobound=False, shared_memory=True, max_inflight=2)
+    assert next(results) == b'x' * 100
+    results.close()
+    assert set(glob.glob('/dev/shm/psm_*')) <= prev_blocks
+
+
+def test_get_usable_cpu_count():
+    assert 1 <= util.get_usable_cpu_count() <= os.cpu_count()
+    with um.patch('os.sched_getaffinity', return_value=set(range(8)), create=True):
+        with um.patch('kkpyutil._read_cgroup_cpu_quota', return_value=2.5):
+            assert util.get_usable_cpu_count() == 3
+            assert util._concur_worker_count(False, 'auto') == 3
+            assert util._concur_worker_count(True, 'auto') == 7
+        with um.patch('kkpyutil._read_cgroup_cpu_quota', return_value=None):
+            assert util.get_usable_cpu_count() == 8
+    # never zero processes on a single CPU
+    with um.patch('kkpyutil.get_usable_cpu_count', return_value=1):
+        assert util._concur_worker_count(False) == 1
+        assert util.concur_map(map_worker, [1, 2], iobound=False) == [2, 4]
+
+
+def test_concur_imap_tune_workers():
+    def _wait(enum):
+        time.sleep(0.02)
+        return enum[1]
+
+    logger = um.MagicMock()
+    assert list(util.concur_imap(_wait, range(50), worker_count='auto', tune_workers=True, logger=logger)) == list(range(50))
+    logger.debug.assert_called_with(f'Tuned concurrency of _wait to {util._MAX_TUNED_IO_THREADS} threads')
+
+
+def test_concur_progress():
+    def _work(enum):
+        i, elem = enum
+        if elem == 3:
+            raise ValueError('bad')
+        time.sleep(0.05 if elem == 9 else 0.001)
+        return elem
+
+    reports = []
+    progress = util.ConcurProgress(callback=lambda p: reports.append((p.nCompleted, p.nInflight)), interval=0)
+    results = util.concur_imap(_work, range(10), worker_count=2, chunksize=2, on_error='skip', progress=progress)
+    assert next(results) == 0
+    assert progress.total == 10
+    assert progress.nSubmitted >= 2
+    assert progress.nCompleted + progress.nInflight == progress.nSubmitted
+    assert list(results) == [1, 2, 4, 5, 6, 7, 8, 9]
+    assert (progress.nCompleted, progress.nFailed, progress.nInflight) == (10, 1, 0)
+    assert sum(progress.latencyHistogram.values()) == 10
+    assert max(progress.latencyHistogram) >= 64
+    assert progress.eta == 0
+    assert reports[-1] == (10, 0)
+    assert str(progress).startswith('completed 10/10 (1 failed), in-flight 0')
+    # unsized input
+    progress = util.ConcurProgress()
+    assert list(util.concur_imap(_work, iter([0, 1]), progress=progress)) == [0, 1]
+    assert progress.total is None and progress.eta is None
+    progress = util.ConcurProgress()
+    progress.start()
+    progress.submit('task', 5, 1)
+    time.sleep(0.01)
+    assert [index for index, age in progress.get_stragglers(0.005)] == [5]
+    assert not progress.get_stragglers(10)
+    # ordered callers blocked on a straggler still see the others complete
+    progress = util.ConcurProgress()
+    results = util.concur_imap(lambda enum: time.sleep(0.5 if enum[0] == 0 else 0.01), range(8), worker_count=2, progress=progress)
+    next(results)
+    assert progress.nCompleted >= 4
+    # stragglers polled from another thread while tasks complete
+    progress = util.ConcurProgress()
+    stop = threading.Event()
+    errors = []
+
+    def _poll():
+        while not stop.is_set():
+            try:
+                progress.get_stragglers(0)
+            except Exception as e:
+                errors.append(e)
+
+    poller = threading.Thread(target=_poll)
+    poller.start()
+    assert len(list(util.concur_imap(lambda enum: enum[1], range(20000), worker_count=8, progress=progress))) == 20000
+    stop.set()
+    poller.join()
+    assert not errors and progress.nCompleted == 20000
+
+
+def test_executor_pool():
+    pool = util.get_executor_pool(iobound=False, worker_count=2, preload=('json',), warm_up=True)
+    assert util.get_executor_pool(iobound=False, worker_count=2, preload=('json',)) is pool
+    assert util.get_executor_pool(iobound=False, worker_count=2) is not pool
+    data = list(range(10))
+    for _ in range(3):
+        assert util.concur_map(map_worker, data, worker_count=2, iobound=False, reuse_pool=True) == [i * 2 for i in data]
+    reused = util.get_executor_pool(iobound=False, worker_count=2)
+    assert list(util.concur_imap(map_worker, data, worker_count=2, iobound=False, reuse_pool=True)) == [i * 2 for i in data]
+    assert util.get_executor_pool(iobound=False, worker_count=2) is reused
+    # forked children start with an empty registry
+    if hasattr(os, 'fork'):
+        rfd, wfd = os.pipe()
+        if (pid := os.fork()) == 0:
+            os.write(wfd, str(len(util._executor_pools)).encode())
+            os._exit(0)
+        os.waitpid(pid, 0)
+        assert os.read(rfd, 16) == b'0'
+        os.close(rfd)
+        os.close(wfd)
+    util.shutdown_executor_pools()
+    assert not util._executor_pools
+    assert util.get_executor_pool(iobound=False, worker_count=2, preload=('json',)) is not pool
+    util.shutdown_executor_pools()
 
 
 def test_profile_runs():
@@ -601,6 +926,67 @@ def test_rerunlock_class(monkeypatch):
     assert str(exc_info.value) == f"Terminated due to signal: {signal.Signals(signal.SIGINT).name}; Will unlock"
 
 
+def test_rerunlock_flock():
+    folder = osp.join(_gen_dir, 'flock')
+    first = util.RerunLock('test_flock', folder, max_instances=2, backend='flock')
+    second = util.RerunLock('test_flock', folder, max_instances=2, backend='flock')
+    third = util.RerunLock('test_flock', folder, max_instances=2, backend='flock')
+    third.logger = um.Mock()
+    assert first.lock() and second.lock()
+    assert first.is_locked() and first.slotFile != second.slotFile
+    assert not third.lock()
+    assert str([os.getpid(), os.getpid()]) in third.logger.warning.call_args[0][0]
+    assert second.unlock()
+    assert not second.unlock()
+    assert third.lock()
+    assert first.unlock_all() and third.unlock()
+    # released by the OS when the holder dies without unlocking
+    code = f'import sys; sys.path.insert(0, {osp.dirname(osp.abspath(util.__file__))!r}); import kkpyutil as util; assert util.RerunLock("test_flock", {folder!r}, backend="flock").lock()'
+    subprocess.run([sys.executable, '-c', code], check=True)
+    assert first.lock()
+    first.unlock()
+
+    @util.rerun_lock('test_flock', folder, backend='flock')
+    def _locked():
+        return 0
+    assert _locked() == 0
+    assert first.lock()
+    assert _locked() == 1
+    first.unlock()
+    with pytest.raises(ValueError):
+        util.RerunLock('test_flock', folder, backend='lockfile')
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def test_rerunlock_zombie_sweep():
+    folder = osp.join(_gen_dir, 'zombie')
+    os.makedirs(folder, exist_ok=True)
+    zombie = osp.join(folder, 'lock_test_zombie.99999999.lock.json')
+    util.touch(zombie)
+    util.RerunLock.lastSweepTimes.clear()
+    handler = signal.getsignal(signal.SIGTERM)
+    with um.patch('kkpyutil.is_pid_running', wraps=util.is_pid_running) as pid_check:
+        lock = util.RerunLock('test_zombie', folder, install_signal_handlers=False)
+        assert not osp.isfile(zombie)
+        assert pid_check.call_count == 1
+        # rate-limited on construction
+        util.touch(zombie)
+        lock = util.RerunLock('test_zombie', folder, install_signal_handlers=False)
+        assert osp.isfile(zombie)
+        assert pid_check.call_count == 1
+        # swept when blocking
+        assert lock.lock()
+        assert not osp.isfile(zombie)
+        assert pid_check.call_count == 2
+        lock.unlock()
+        # no contention, no sweep
+        assert lock.lock()
+        assert pid_check.call_count == 2
+        lock.unlock()
+    assert signal.getsignal(signal.SIGTERM) is handler
+    shutil.rmtree(folder, ignore_errors=True)
+
+
 def test_rerun_lock(monkeypatch):
     @util.rerun_lock('test', _gen_dir)
     def _worker():
@@ -771,6 +1157,46 @@ def test_run_cmd():
     cmd = [py, osp.join(_org_dir, 'my_cmd.py'), 100]
     proc = util.run_cmd(cmd, useexception=False)
     assert proc.returncode == 0, 'expected util.run_cmd() to have converted number to str'
+    # disabled levels skip decoding and formatting
+    cmd = [py, '-c', 'print("x" * 10000)']
+    logger = um.Mock()
+    logger.isEnabledFor.return_value = False
+    with um.patch.object(util, 'safe_decode_bytes') as mock_decode:
+        util.run_cmd(cmd, logger=logger)
+        mock_decode.assert_not_called()
+    logger.info.assert_not_called()
+    logger.log.assert_not_called()
+    # capped output
+    logger.isEnabledFor.return_value = True
+    util.run_cmd(cmd, logger=logger, verbose=True, max_logged_bytes=100)
+    level, msg = logger.log.call_args[0]
+    assert level == logging.INFO
+    assert msg.startswith('stdout:\n' + 'x' * 50)
+    assert 'bytes skipped' in msg
+    assert len(msg) < 200
+
+
+def test_run_cmd_streamed():
+    py = 'python' if util.PLATFORM == 'Windows' else 'python3'
+    out_file = osp.join(_gen_dir, 'streamed', 'out.log')
+    cmd = [py, '-c', 'import sys; print("x" * 100000); sys.stderr.write("oops")']
+    proc = util.run_cmd(cmd, stdout_to=out_file)
+    assert isinstance(proc.stdout, util.FileBackedOutput)
+    assert len(proc.stdout) == len(f'{"x" * 100000}{os.linesep}')
+    assert proc.stdout.decode(util.LOCALE_CODEC).strip() == 'x' * 100000
+    assert b''.join(proc.stdout.iter_chunks(1000)) == bytes(proc.stdout)
+    assert proc.stderr == b'oops'
+    # merged streams
+    proc = util.run_cmd(cmd, stdout_to=out_file, stderr_to=out_file)
+    assert proc.stdout is proc.stderr
+    assert proc.stdout.read().endswith(b'oops')
+    # failure keeps the views
+    cmd = [py, '-c', 'import sys; print("partial"); sys.exit(3)']
+    with open(out_file, 'wb') as fp:
+        proc = util.run_cmd(cmd, stdout_to=fp, useexception=False)
+    assert proc.returncode == 1
+    assert proc.stdout.read().strip() == b'partial'
+    util.safe_remove(_gen_dir)
 
 
 def test_run_daemon():
@@ -817,6 +1243,151 @@ def test_watch_cmd():
     assert proc.returncode == 2
     err_log = proc.stderr.decode(util.LOCALE_CODEC)
     assert 'missing' in err_log or '[WinError 2]' in err_log
+    # idle child costs the watcher no CPU
+    cmd = [py, '-c', 'import time; print("tick", flush=True); time.sleep(1); print("tock")']
+    cpu_start = time.process_time()
+    proc = util.watch_cmd(cmd, logger=logger)
+    assert time.process_time() - cpu_start < 0.5
+    assert proc.stdout.decode(util.LOCALE_CODEC) == f'tick{os.linesep}tock{os.linesep}'
+
+
+def test_watch_cmd_callbacks():
+    py = 'python' if util.PLATFORM == 'Windows' else 'python3'
+    cmd = [py, '-c', 'import sys; [print(f"line {i}") for i in range(1000)]; sys.stdout.write("last"); sys.stderr.write("err")']
+    lines = []
+    errs = []
+    proc = util.watch_cmd(cmd, on_stdout=lines.append, on_stderr=errs.append, keep_output=False, tail_lines=2)
+    assert proc.returncode == 0
+    assert len(lines) == 1001
+    assert lines[0] == 'line 0\n' and lines[-1] == 'last'
+    assert errs == ['err']
+    assert proc.stdout.decode(util.LOCALE_CODEC) == 'line 999\nlast'
+    assert proc.stderr.decode(util.LOCALE_CODEC) == 'err'
+    # no retention
+    proc = util.watch_cmd(cmd, on_stdout=lines.append, keep_output=False)
+    assert proc.stdout == b''
+    # callbacks with full output
+    proc = util.watch_cmd(cmd, on_stdout=lambda line: None)
+    assert proc.stdout.decode(util.LOCALE_CODEC).endswith('line 999\nlast')
+    # progress bars redrawn with \r, and unterminated output of bounded length
+    cmd = [py, '-c', 'import sys; [sys.stdout.write(f"{i}%\\r") for i in range(101)]; sys.stdout.write("done\\r\\n" + "x" * 3000000)']
+    lines = []
+    proc = util.watch_cmd(cmd, on_stdout=lines.append, keep_output=False)
+    assert proc.returncode == 0
+    assert lines[:101] == [f'{i}%\r' for i in range(101)]
+    assert lines[101] == 'done\r\n'
+    assert ''.join(lines[102:]) == 'x' * 3000000
+    assert len(lines) > 103 and max(len(line) for line in lines) < 3000000
+
+
+def test_arun_cmd():
+    import asyncio
+    py = 'python' if util.PLATFORM == 'Windows' else 'python3'
+    cmd = [py, osp.join(_org_dir, 'my_cmd.py'), 100]
+    proc = asyncio.run(util.arun_cmd(cmd, useexception=False))
+    assert proc.returncode == 0
+    assert b'OK' in proc.stdout
+    # child cmd exception
+    cmd = [py, '-c', 'raise RuntimeError("failed")']
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(util.arun_cmd(cmd))
+    proc = asyncio.run(util.arun_cmd(cmd, useexception=False))
+    assert proc.returncode == 1
+    assert b'RuntimeError' in proc.stderr
+    proc = asyncio.run(util.arun_cmd(cmd, check=False))
+    assert proc.returncode == 1
+    # generic exception
+    cmd = ['missing']
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(util.arun_cmd(cmd))
+    proc = asyncio.run(util.arun_cmd(cmd, useexception=False))
+    assert proc.returncode == 2
+    assert 'missing' in proc.stderr.decode(util.LOCALE_CODEC) or '[WinError 2]' in proc.stderr.decode(util.LOCALE_CODEC)
+    # cancellation kills the child right away
+    os.makedirs(_gen_dir, exist_ok=True)
+    pid_file = osp.join(_gen_dir, 'arun_cmd_cancelled.pid')
+    cmd = [py, '-c', f'import os, time; open({pid_file!r}, "w").write(str(os.getpid())); time.sleep(3)']
+
+    async def _cancel(acoro):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(acoro(cmd), timeout=0.5)
+        pid = int(util.load_text(pid_file))
+        if util.PLATFORM != 'Windows':
+            with pytest.raises(ProcessLookupError):
+                os.kill(pid, 0)
+
+    for acoro in (util.arun_cmd, util.awatch_cmd):
+        asyncio.run(_cancel(acoro))
+    util.safe_remove(_gen_dir)
+
+
+def test_arun_daemon():
+    import asyncio
+
+    async def _run(cmd):
+        proc = await util.arun_daemon(cmd, useexception=False)
+        if isinstance(proc, types.SimpleNamespace):
+            return proc
+        await proc.communicate()
+        return proc
+
+    ls = 'dir' if util.PLATFORM == 'Windows' else 'ls'
+    assert asyncio.run(_run([ls])).returncode == 0
+    assert asyncio.run(_run(['missing'])).returncode == 2
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(util.arun_daemon(['missing']))
+
+
+def test_awatch_cmd():
+    import asyncio
+    py = 'python' if util.PLATFORM == 'Windows' else 'python3'
+    lines = []
+
+    async def _on_stdout(line):
+        lines.append(line)
+
+    cmd = [py, '-c', 'import sys; print("hello"); print("x" * 100000); sys.stdout.write("world")']
+    proc = asyncio.run(util.awatch_cmd(cmd, on_stdout=_on_stdout))
+    assert proc.returncode == 0
+    assert lines == ['hello\n', f'{"x" * 100000}\n', 'world']
+    assert proc.stdout.decode(util.LOCALE_CODEC) == ''.join(lines)
+    lines.clear()
+    cmd = [py, '-c', 'import sys; [sys.stdout.write(f"{i}%\\r") for i in range(3)]; sys.stdout.write("x" * 3000000)']
+    proc = asyncio.run(util.awatch_cmd(cmd, on_stdout=_on_stdout))
+    assert lines[:3] == ['0%\r', '1%\r', '2%\r']
+    assert ''.join(lines[3:]) == 'x' * 3000000 and len(lines) > 4
+    cmd = [py, osp.join(_org_dir, 'child_proc_prints.py'), 'suberr']
+    proc = asyncio.run(util.awatch_cmd(cmd, useexception=False))
+    assert proc.returncode == 1
+    assert 'CalledProcessError' in proc.stderr.decode(util.LOCALE_CODEC)
+    proc = asyncio.run(util.awatch_cmd(cmd, keep_output=False, tail_lines=1))
+    assert 'CalledProcessError' in proc.stderr.decode(util.LOCALE_CODEC)
+    assert len(proc.stderr.decode(util.LOCALE_CODEC).splitlines()) == 1
+    proc = asyncio.run(util.awatch_cmd(['missing'], useexception=False))
+    assert proc.returncode == 2
+
+
+def test_run_cmds():
+    py = 'python' if util.PLATFORM == 'Windows' else 'python3'
+    cmds = [[py, '-c', f'import time; time.sleep(0.5); print({i})'] for i in range(6)]
+    stats = types.SimpleNamespace()
+    results = list(util.run_cmds(iter(cmds), max_parallel=3, stats=stats))
+    assert sorted(res.index for res in results) == list(range(6))
+    assert all(res.returncode == 0 and res.stdout.strip() == str(res.index).encode() for res in results)
+    assert stats.count == 6 and stats.failed == 0
+    assert stats.wallSec < stats.totalSec
+    # timeout and startup errors are reported instead of raised
+    cmds = [[py, '-c', 'import time; time.sleep(10)'], ['missing']]
+    results = sorted(util.run_cmds(cmds, timeout=0.5), key=lambda r: r.index)
+    assert results[0].timedout and results[0].returncode != 0
+    assert results[1].returncode == 2
+    # fail fast
+    cmds = [[py, '-c', 'raise RuntimeError("failed")']] + [[py, '-c', 'import time; time.sleep(10)']] * 3
+    start = time.time()
+    results = list(util.run_cmds(cmds, max_parallel=2, fail_fast=True, stats=stats))
+    assert time.time() - start < 5
+    assert [res.index for res in results] == [0]
+    assert stats.count == 1 and stats.failed == 1
 
 
 def test_extract_call_args():
@@ -2336,6 +2907,218 @@ def test_cache():
     assert cache._compute_hash_as_modified_time() is None
 
 
+def test_cache_hybrid():
+    src_file = osp.join(_gen_dir, 'data.json')
+    util.save_json(src_file, {'a': 1})
+    cache = util.Cache(src_file, util.load_json, cache_type='test_hybrid', algo='hybrid')
+    util.safe_remove(cache.cacheFile)
+    cache = util.Cache(src_file, util.load_json, cache_type='test_hybrid', algo='hybrid')
+    with um.patch('kkpyutil.get_md5_checksum', wraps=util.get_md5_checksum) as checksum:
+        assert cache.retrieve() == {'a': 1}
+        assert checksum.call_count == 1
+        # unchanged stat: no rehash, also across sessions
+        assert cache.retrieve() == {'a': 1}
+        assert util.Cache(src_file, util.load_json, cache_type='test_hybrid', algo='hybrid').retrieve() == {'a': 1}
+        assert checksum.call_count == 1
+        # touched: rehash once, then remember the new stat
+        t = time.time() + 10
+        os.utime(src_file, (t, t))
+        assert cache.retrieve() == {'a': 1}
+        assert checksum.call_count == 2
+        assert util.load_json(cache.cacheFile)['stat'][1] == os.stat(src_file).st_mtime_ns
+        assert util.Cache(src_file, util.load_json, cache_type='test_hybrid', algo='hybrid').retrieve() == {'a': 1}
+        assert checksum.call_count == 2
+        # changed
+        util.save_json(src_file, {'a': 2})
+        assert cache.retrieve() == {'a': 2}
+        assert checksum.call_count == 3
+        # forced re-verification
+        cache = util.Cache(src_file, util.load_json, cache_type='test_hybrid', algo='hybrid', reverify_interval=0)
+        assert cache.retrieve() == {'a': 2}
+        assert checksum.call_count == 4
+        # new instances sharing the memory tier also know when the source was last hashed
+        util.Cache.memoryTier.clear()
+        for _ in range(3):
+            assert util.Cache(src_file, util.load_json, cache_type='test_hybrid', algo='hybrid', reverify_interval=3600, memory_tier=True).retrieve() == {'a': 2}
+        assert checksum.call_count == 4
+    util.safe_remove(_gen_dir)
+
+
+def test_cache_serializers():
+    src_file = osp.join(_gen_dir, 'data.json')
+    util.save_json(src_file, {'a': [1, 2], 'b': 'ü'})
+
+    def _retrieve_with_tuple(src):
+        data = util.load_json(src)
+        data['t'] = (1, 2)
+        return data
+
+    for serializer, compression in (('json-compact', None), ('json', 'zlib'), ('pickle', None), ('pickle', 'lzma'), ('marshal', 'zlib')):
+        cache = util.Cache(src_file, _retrieve_with_tuple, cache_type='test_ser', serializer=serializer, compression=compression)
+        util.safe_remove(cache.cacheFile)
+        cache = util.Cache(src_file, _retrieve_with_tuple, cache_type='test_ser', serializer=serializer, compression=compression)
+        assert cache.retrieve()['b'] == 'ü'
+        with open(cache.cacheFile, 'rb') as f:
+            assert f.readline() == b'kkpyutil.Cache\n'
+            header = json.loads(f.readline())
+        assert (header['format'], header['compression']) == (serializer, compression)
+        assert cache.retrieve()['t'] == ((1, 2) if serializer in ('pickle', 'marshal') else [1, 2])
+        # cache hit, read back by an instance with another serializer, unless the payload may run code
+        loaded = util.Cache(src_file, util.load_json, cache_type='test_ser').retrieve()
+        assert loaded['a'] == [1, 2]
+        assert loaded.get('t') == (None if serializer in ('pickle', 'marshal') else [1, 2])
+    # planted pickle payload is rebuilt instead of loaded
+    marker = osp.join(_gen_dir, 'unpickled')
+
+    class _Exploit:
+        def __reduce__(self):
+            return os.makedirs, (marker,)
+
+    util.Cache(src_file, lambda src: {'x': _Exploit()}, cache_type='test_ser', serializer='pickle').update()
+    assert util.Cache(src_file, util.load_json, cache_type='test_ser').retrieve() == util.load_json(src_file)
+    assert not osp.exists(marker)
+    # legacy layout
+    cache = util.Cache(src_file, util.load_json, cache_type='test_ser')
+    util.save_json(src_file, {'a': 3})
+    assert cache.retrieve() == {'a': 3}
+    assert util.load_json(cache.cacheFile)['data'] == {'a': 3}
+    with pytest.raises(AssertionError):
+        util.Cache(src_file, util.load_json, serializer='yaml')
+    util.safe_remove(_gen_dir)
+
+
+def test_cache_store():
+    folder = osp.join(_gen_dir, 'store')
+    shutil.rmtree(folder, ignore_errors=True)
+    srcs = [osp.join(_gen_dir, f'src{i}.json') for i in range(3)]
+    for i, src in enumerate(srcs):
+        util.save_json(src, {'i': i})
+    store = util.CacheStore(folder, max_entries=2)
+    caches = [util.Cache(src, util.load_json, store=store, memory_tier=True) for src in srcs]
+    assert osp.dirname(caches[0].cacheFile) == folder
+    caches[0].retrieve()
+    caches[1].retrieve()
+    # hit makes 0 the most recently used
+    caches[0].retrieve()
+    caches[2].retrieve()
+    assert store.nEvicted == 1
+    assert not osp.isfile(caches[1].cacheFile)
+    assert caches[1].cacheFile not in util.Cache.memoryTier
+    assert sorted(store.entries) == sorted(osp.basename(caches[i].cacheFile) for i in (0, 2))
+    # evicted cache is rebuilt
+    assert caches[1].retrieve() == {'i': 1}
+    assert not osp.isfile(caches[0].cacheFile)
+    # index persists
+    store.flush()
+    reloaded = util.CacheStore(folder, max_entries=2)
+    assert reloaded.entries == store.entries and reloaded.totalBytes == store.totalBytes
+    # lfu by bytes
+    shutil.rmtree(folder)
+    store = util.CacheStore(folder, policy='lfu')
+    caches = [util.Cache(src, util.load_json, store=store, serializer='json-compact') for src in srcs]
+    caches[0].retrieve()
+    # room for 2.5 caches, keeping 2 after evicting down to 90%
+    store.maxBytes = int(2.5 * osp.getsize(caches[0].cacheFile))
+    caches[0].retrieve()
+    caches[1].retrieve()
+    caches[2].retrieve()
+    assert osp.isfile(caches[0].cacheFile) and not osp.isfile(caches[1].cacheFile)
+    # adopt caches written without a store
+    util.Cache(srcs[1], util.load_json, cache_dir=folder).retrieve()
+    assert len(store.entries) == 2
+    store.rebuild_index()
+    assert len(store.entries) == 2 and store.totalBytes <= store.maxBytes
+    util.safe_remove(_gen_dir)
+
+
+def test_cache_tree_source():
+    src_dir = osp.join(_gen_dir, 'tree')
+    shutil.rmtree(src_dir, ignore_errors=True)
+    for i in range(5):
+        util.save_json(osp.join(src_dir, f'sub{i % 2}', f'{i}.json'), {'i': i})
+
+    def _retrieve_tree(src):
+        return sorted(util.load_json(file)['i'] for file in glob.glob(osp.join(src_dir, '**', '*.json'), recursive=True))
+
+    for source in (src_dir, osp.join(src_dir, '**', '*.json'), [osp.join(src_dir, 'sub0', '*.json'), osp.join(src_dir, 'sub1')]):
+        cache = util.Cache(source, _retrieve_tree, cache_type='test_tree', algo='hybrid')
+        util.safe_remove(cache.cacheFile)
+        cache = util.Cache(source, _retrieve_tree, cache_type='test_tree', algo='hybrid')
+        assert cache.srcIsTree
+        with um.patch('kkpyutil.get_md5_checksum', wraps=util.get_md5_checksum) as checksum:
+            assert cache.retrieve() == [0, 1, 2, 3, 4]
+            assert checksum.call_count == 5
+            # unchanged across sessions: no rehash
+            cache = util.Cache(source, _retrieve_tree, cache_type='test_tree', algo='hybrid')
+            assert not cache._compare_hash()
+            assert checksum.call_count == 5
+            # only the changed file is rehashed
+            util.save_json(osp.join(src_dir, 'sub1', '3.json'), {'i': 30})
+            assert cache.retrieve() == [0, 1, 2, 4, 30]
+            assert checksum.call_count == 6
+            # touched without change: rehashed, but same fingerprint
+            t = time.time() + 10
+            os.utime(osp.join(src_dir, 'sub0', '0.json'), (t, t))
+            assert not cache._compare_hash()
+            assert checksum.call_count == 7
+        util.save_json(osp.join(src_dir, 'sub1', '3.json'), {'i': 3})
+    # added and removed files
+    cache = util.Cache(src_dir, _retrieve_tree, cache_type='test_tree', algo='mtime')
+    cache.retrieve()
+    util.save_json(osp.join(src_dir, '5.json'), {'i': 5})
+    assert cache.retrieve() == [0, 1, 2, 3, 4, 5]
+    os.remove(osp.join(src_dir, 'sub0', '0.json'))
+    assert cache.retrieve() == [1, 2, 3, 4, 5]
+    assert not util.Cache(osp.join(src_dir, '5.json'), _retrieve_tree).srcIsTree
+    # instances from the memory tier keep the per-file table: only the changed file is rehashed
+    util.Cache.memoryTier.clear()
+    cache = util.Cache(src_dir, _retrieve_tree, cache_type='test_tree_mem', algo='hybrid', memory_tier=True)
+    util.safe_remove(cache.cacheFile)
+    cache = util.Cache(src_dir, _retrieve_tree, cache_type='test_tree_mem', algo='hybrid', memory_tier=True)
+    assert cache.retrieve() == [1, 2, 3, 4, 5]
+    util.save_json(osp.join(src_dir, '5.json'), {'i': 50})
+    with um.patch('kkpyutil.get_md5_checksum', wraps=util.get_md5_checksum) as checksum:
+        cache = util.Cache(src_dir, _retrieve_tree, cache_type='test_tree_mem', algo='hybrid', memory_tier=True)
+        assert cache.retrieve() == [1, 2, 3, 4, 50]
+        assert checksum.call_count == 1
+    util.save_json(bracketed_file := osp.join(src_dir, 'file[1].json'), {'i': 1})
+    cache = util.Cache(bracketed_file, util.load_json, cache_type='test_tree')
+    assert not cache.srcIsTree
+    assert cache.retrieve() == {'i': 1}
+    util.safe_remove(_gen_dir)
+
+
+def test_cache_memory_tier():
+    src_file = osp.join(_gen_dir, 'data.json')
+    util.save_json(src_file, {'a': 1})
+    util.Cache.memoryTier.clear()
+    cache = util.Cache(src_file, util.load_json, cache_type='test_mem', memory_tier=True)
+    assert cache.retrieve() == {'a': 1}
+    # hits skip hashing and the disk tier, across instances
+    with um.patch('kkpyutil.load_json') as load, um.patch('kkpyutil.get_md5_checksum') as checksum:
+        assert cache.retrieve() == {'a': 1}
+        assert util.Cache(src_file, util.load_json, cache_type='test_mem', memory_tier=True).retrieve() == {'a': 1}
+        load.assert_not_called()
+        checksum.assert_not_called()
+    util.save_json(src_file, {'a': 1, 'b': 2})
+    assert cache.retrieve() == {'a': 1, 'b': 2}
+    assert util.Cache.memoryTier[cache.cacheFile][2] == {'a': 1, 'b': 2}
+    # disk hit refills the tier
+    util.Cache.memoryTier.clear()
+    assert util.Cache(src_file, util.load_json, cache_type='test_mem', memory_tier=True).retrieve() == {'a': 1, 'b': 2}
+    assert cache.cacheFile in util.Cache.memoryTier
+    # bounded
+    with um.patch.object(util.Cache, 'memoryTierSize', 1):
+        other = util.Cache(src_file, util.load_json, cache_type='test_mem2', memory_tier=True)
+        other.retrieve()
+        assert list(util.Cache.memoryTier) == [other.cacheFile]
+    # opt-in
+    util.Cache.memoryTier.clear()
+    util.Cache(src_file, util.load_json, cache_type='test_mem').retrieve()
+    assert not util.Cache.memoryTier
+    util.safe_remove(_gen_dir)
+
+
 def test_mem_caching():
     @util.mem_caching(maxsize=None)
     def load(src):
@@ -2624,6 +3407,93 @@ def _do_it_until_proc_timeout_bypassed():
     util.run_cmd(cmd, cwd=_org_dir)
 
 
+@util.thread_timeout(1)
+def _add_in_thread(a, b):
+    if b is None:
+        raise ValueError('no b')
+    return a + b
+
+
+@util.thread_timeout(0.2, cancellable=True)
+def _wait_in_thread(sec, cancel_token=None):
+    cancel_token.sleep(sec)
+    cancel_token.check()
+
+
+@util.thread_timeout(0.2)
+def _hang_in_thread(stop):
+    stop.wait()
+
+
+def test_thread_timeout_result():
+    assert _add_in_thread(1, 2) == 3
+    with pytest.raises(ValueError):
+        _add_in_thread(1, None)
+    # cancelled task returns early, leaving no orphan behind for long
+    with pytest.raises(TimeoutError):
+        _wait_in_thread(10)
+    time.sleep(0.1)
+    assert not util.get_thread_timeout_orphans()
+    # non-cancellable task is tracked until it returns
+    stop = threading.Event()
+    with pytest.raises(TimeoutError):
+        _hang_in_thread(stop)
+    orphans = util.get_thread_timeout_orphans()
+    assert [orphan.name for orphan in orphans] == ['_hang_in_thread']
+    assert orphans[0].token is None
+    stop.set()
+    time.sleep(0.1)
+    assert not util.get_thread_timeout_orphans()
+    # orphans filling the shared pool do not starve other functions
+    stop.clear()
+    n_workers = util._get_thread_timeout_executor()._max_workers
+    try:
+        for _ in range(n_workers):
+            with pytest.raises(TimeoutError):
+                _hang_in_thread(stop)
+        assert len(util.get_thread_timeout_orphans()) == n_workers
+        assert _add_in_thread(1, 2) == 3
+    finally:
+        stop.set()
+    time.sleep(0.1)
+    assert not util.get_thread_timeout_orphans()
+    assert util._get_thread_timeout_executor()._max_workers == n_workers
+
+
+_timeout_pool = util.TimeoutProcessPool(size=2, max_tasks=3)
+
+
+@util.process_timeout(1, pool=_timeout_pool)
+def _sleep_in_pool(sec):
+    time.sleep(sec)
+    return os.getpid()
+
+
+@util.process_timeout(1, pool=_timeout_pool)
+def _raise_in_pool():
+    raise ValueError('failed in pool')
+
+
+def test_process_timeout_pool():
+    # warm reuse
+    pid1 = _sleep_in_pool(0)
+    pid2 = _sleep_in_pool(0)
+    assert pid1 == pid2 != os.getpid()
+    # recycled after max_tasks
+    assert isinstance(_raise_in_pool(), ValueError)
+    assert _timeout_pool.nRetired == 1
+    pid3 = _sleep_in_pool(0)
+    assert pid3 != pid1
+    # replaced after timeout
+    with pytest.raises(TimeoutError):
+        _sleep_in_pool(2)
+    assert _timeout_pool.nRetired == 2
+    assert _sleep_in_pool(0) not in (pid1, pid3)
+    assert _timeout_pool.nSpawned == 3
+    _timeout_pool.shutdown()
+    assert _timeout_pool.idleWorkers.empty()
+
+
 def test_timeout():
     with pytest.raises(TimeoutError):
         _do_it_until_thread_timeout(2)